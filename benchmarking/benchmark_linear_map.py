@@ -0,0 +1,37 @@
+import sys
+import time
+import logging
+import numpy as np
+from simulations.graphsimulator import GraphSimulator
+from graph_peak_caller.control.linearmap import LinearMap
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def time_builder(builder, graph, n_repeats=3):
+    times = []
+    for _ in range(n_repeats):
+        t = time.time()
+        linear_map = builder(graph)
+        times.append(time.time()-t)
+    return min(times), linear_map
+
+
+def benchmark(n_paths, n_basepairs, n_snps):
+    graph = GraphSimulator(n_paths, n_basepairs, n_snps).get_simulated_graph().graph
+    graph.convert_to_numpy_backend()
+    old_time, old_map = time_builder(
+        LinearMap.from_graph_by_node_traversal, graph)
+    new_time, new_map = time_builder(LinearMap.from_graph, graph)
+    assert np.all(old_map._node_starts == new_map._node_starts)
+    assert np.allclose(old_map._node_ends, new_map._node_ends)
+    print("%d paths, %d bp, %d snps, %d nodes: "
+          "node traversal %.3fs, csr %.3fs (%.1fx)" % (
+              n_paths, n_basepairs, n_snps, len(graph.blocks),
+              old_time, new_time, old_time/new_time))
+
+
+if __name__ == "__main__":
+    n_paths = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for n_snps in [100, 1000, 10000]:
+        benchmark(n_paths, n_snps*20, n_snps)
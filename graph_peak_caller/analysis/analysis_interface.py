@@ -15,8 +15,7 @@ from .fimowrapper import FimoFile
 from ..peakcollection import Peak, PeakCollection
 from .nongraphpeaks import NonGraphPeakCollection
 from .motifenrichment import plot_true_positives
-from ..peakfasta import PeakFasta
-from ..mindense import DensePileup
+from ..peakfasta import PeakFasta, SequenceIndex
 from ..sparsediffs import SparseValues, SparseDiffs
 from ..intervals import UniqueIntervals
 from .util import create_linear_path
@@ -387,10 +386,7 @@ def peaks_to_linear(args):
 
 def get_summits(args):
     graph = args.graph
-    qvalues = SparseDiffs.from_sparse_files(args.q_values_base_name)
-    #qvalues = SparseValues.from_sparse_files(args.q_values_base_name)
-    dense_qvalues = qvalues.to_dense_pileup(size=graph.number_of_basepairs())
-    qvalues = DensePileup(graph, dense_qvalues)
+    qvalues = SparseValues.from_sparse_files(args.q_values_base_name)
     logging.info("Q values fetched")
     peaks = PeakCollection.from_fasta_file(args.peaks_fasta_file, graph)
 
@@ -400,17 +396,14 @@ def get_summits(args):
         window = 60
         logging.warning("Using default window size %d when cutting peaks around summits." % window)
 
-    peaks.cut_around_summit(qvalues, n_base_pairs_around=window)
+    peaks.cut_around_summit(qvalues, graph, n_base_pairs_around=window)
     out_file_name = args.peaks_fasta_file.split(".")[0] + "_summits.fasta"
     peaks.to_fasta_file(out_file_name, args.sequence_graph)
     logging.info("Wrote summits to " + out_file_name)
 
 def get_super_summits(args):
     graph = args.graph
-    qvalues = SparseDiffs.from_sparse_files(args.q_values_base_name)
-    #qvalues = SparseValues.from_sparse_files(args.q_values_base_name)
-    dense_qvalues = qvalues.to_dense_pileup(size=graph.number_of_basepairs())
-    qvalues = DensePileup(graph, dense_qvalues)
+    qvalues = SparseValues.from_sparse_files(args.q_values_base_name)
     logging.info("Q values fetched")
     peaks = PeakCollection.from_fasta_file(args.peaks_fasta_file, graph)
 
@@ -422,7 +415,8 @@ def get_super_summits(args):
 
     from offsetbasedgraph import NumpyIndexedInterval
     linear_ref = NumpyIndexedInterval.from_file(args.linear_ref)
-    peaks.cut_around_summit_super(qvalues, linear_ref, n_base_pairs_around=window)
+    peaks.cut_around_summit_super(qvalues, graph, linear_ref,
+                                n_base_pairs_around=window)
     out_file_name = args.peaks_fasta_file.split(".")[0] + "_summits.fasta"
     peaks.to_fasta_file(out_file_name, args.sequence_graph)
     logging.info("Wrote summits to " + out_file_name)
@@ -569,7 +563,7 @@ def plot_motif_enrichment(args):
 
 def peaks_to_fasta(args):
     logging.info("Getting sequence retriever")
-    retriever = obg.SequenceGraph.from_file(args.sequence_graph)
+    retriever = SequenceIndex.from_file(args.sequence_graph)
     logging.info("Getting intervals")
     intervals = PeakCollection.create_generator_from_file(
         args.intervals_file_name)
@@ -1,17 +1,26 @@
 import logging
 import numpy as np
-from .mindense import DensePileup
 from .sample import get_fragment_pileup
 from .control import get_background_track_from_control,\
     get_background_track_from_input, scale_tracks
-from .sparsepvalues import PValuesFinder, PToQValuesMapper, QValuesFinder
+from .sparsepvalues import PValuesFinder, PToQValuesMapper, QValuesFinder,\
+    PValuesHistogram, get_p_values_cache
 from .postprocess import HolesCleaner, SparseMaxPaths
 from .sparsediffs import SparseValues
+from .peakcollection import get_peak_scores
+from .profiling import profiled
 import json
 import sys
 
 
 class Configuration:
+    # Fields that change the output of a run. Checkpoints are only
+    # invalidated when one of these changes
+    output_fields = ("read_length", "fragment_length", "linear_map_name",
+                     "has_control", "q_values_threshold", "global_min",
+                     "keep_duplicates", "use_array_extender",
+                     "p_values_lambda_decimals")
+
     def __init__(self):
         self.read_length = None
         self.fragment_length = None
@@ -20,6 +29,11 @@ class Configuration:
         self.q_values_threshold = 0.05
         self.global_min = None
         self.keep_duplicates = False
+        self.use_array_extender = True
+        self.p_values_cache_size = 0
+        self.p_values_lambda_decimals = None
+        self.background_cache_dir = None
+        self.background_cache_max_size = 10*1024**3
 
     def copy(self):
         o = Configuration()
@@ -30,6 +44,11 @@ class Configuration:
         o.q_values_threshold = self.q_values_threshold
         o.global_min = self.global_min
         o.keep_duplicates = self.keep_duplicates
+        o.use_array_extender = self.use_array_extender
+        o.p_values_cache_size = self.p_values_cache_size
+        o.p_values_lambda_decimals = self.p_values_lambda_decimals
+        o.background_cache_dir = self.background_cache_dir
+        o.background_cache_max_size = self.background_cache_max_size
         return o
 
 
@@ -44,11 +63,15 @@ class CallPeaks(object):
         self._reporter = reporter
         self.variant_maps = variant_maps
 
+    @profiled("pre_callpeaks", n_sample_indices="sample_pileup",
+              n_control_indices="control_pileup",
+              n_touched_nodes="touched_nodes")
     def run_pre_callpeaks(self, input_reads, control_reads):
         try:
-            sample_pileup = get_fragment_pileup(
-                self.graph, input_reads, self.config,
-                self._reporter)
+            with self._reporter.stage("sample_pileup"):
+                sample_pileup = get_fragment_pileup(
+                    self.graph, input_reads, self.config,
+                    self._reporter)
 
             background_func = get_background_track_from_control
         except json.decoder.JSONDecodeError as e:
@@ -59,9 +82,10 @@ class CallPeaks(object):
 
         if not self.config.has_control:
             background_func = get_background_track_from_input
-        control_pileup = background_func(self.graph, control_reads,
-                                         self.config,
-                                         sample_pileup.touched_nodes)
+        with self._reporter.stage("control_pileup"):
+            control_pileup = background_func(self.graph, control_reads,
+                                             self.config,
+                                             sample_pileup.touched_nodes)
         scale_tracks(sample_pileup, control_pileup,
                      input_reads.n_reads/control_reads.n_reads)
 
@@ -72,22 +96,31 @@ class CallPeaks(object):
         self.control_pileup = control_pileup
         self.sample_pileup = sample_pileup
 
+    @profiled("p_values", n_p_values_indices="p_values_pileup")
     def get_p_values(self):
         assert self.sample_pileup is not None
         assert self.control_pileup is not None
         self.p_values_pileup = PValuesFinder(
-            self.sample_pileup, self.control_pileup).get_p_values_pileup()
+            self.sample_pileup, self.control_pileup,
+            get_p_values_cache(self.config.p_values_cache_size,
+                               self.config.p_values_lambda_decimals)
+        ).get_p_values_pileup()
         self.p_values_pileup.track_size = self.graph.node_indexes[-1]
         self._reporter.add("pvalues", self.p_values_pileup)
+        self._reporter.add("pvalues_histogram",
+                           PValuesHistogram.from_p_values_pileup(
+                               self.p_values_pileup))
         self.sample_pileup = None
         self.control_pileup = None
 
+    @profiled("p_to_q_values_mapping")
     def get_p_to_q_values_mapping(self):
         assert self.p_values_pileup is not None
         finder = PToQValuesMapper.from_p_values_pileup(
             self.p_values_pileup)
-        self.p_to_q_values_mapping = finder.get_p_to_q_values()
+        self.p_to_q_values_mapping = finder.get_p_to_q_table()
 
+    @profiled("q_values", n_q_values_indices="q_values_pileup")
     def get_q_values(self):
         assert self.p_values_pileup is not None
         assert self.p_to_q_values_mapping is not None
@@ -99,6 +132,7 @@ class CallPeaks(object):
         self.q_values_pileup.track_size = self.p_values_pileup.track_size
         self._reporter.add("qvalues", self.q_values_pileup)
 
+    @profiled("call_peaks_from_q_values", n_max_paths="max_path_peaks")
     def call_peaks_from_q_values(self, linear_path=None):
         assert self.q_values_pileup is not None
         caller = CallPeaksFromQvalues(
@@ -147,12 +181,14 @@ class CallPeaksFromQvalues:
         # self.info.to_file(self.out_file_base_name + "experiment_info.pickle")
         logging.info("Using q value cutoff %.4f" % self.cutoff)
 
+    @profiled("threshold", n_thresholded_indices="pre_processed_peaks")
     def __threshold(self):
         threshold = -np.log10(self.cutoff)
         logging.info("Thresholding peaks on q value %.4f" % threshold)
         self.pre_processed_peaks = self.q_values.threshold_copy(threshold)
         self._reporter.add("thresholded", self.pre_processed_peaks)
 
+    @profiled("hole_cleaning", n_hole_cleaned_indices="pre_processed_peaks")
     def __postprocess(self):
         logging.info("Filling small Holes")
         self.pre_processed_peaks = HolesCleaner(
@@ -164,6 +200,7 @@ class CallPeaksFromQvalues:
         self._reporter.add("hole_cleaned", self.pre_processed_peaks)
         self.filtered_peaks = self.pre_processed_peaks
 
+    @profiled("max_paths", n_max_paths="max_paths")
     def __get_max_paths(self):
         logging.info("Getting maxpaths")
         if not self.q_values_max_path:
@@ -177,29 +214,29 @@ class CallPeaksFromQvalues:
 
         assert(self.graph.uses_numpy_backend)
         logging.info("Running Sparse Max Paths")
-        max_paths, sub_graphs = SparseMaxPaths(
-            self.filtered_peaks, self.graph, _pileup, self.variant_maps).run()
+        with self._reporter.stage("sparse_max_paths"):
+            max_paths, sub_graphs = SparseMaxPaths(
+                self.filtered_peaks, self.graph, _pileup,
+                self.variant_maps).run()
 
         self._reporter.add("all_max_paths", max_paths)
         logging.info("All max paths found")
 
-        self.q_values = DensePileup(
-            self.graph, self.q_values.to_dense_pileup(
-                self.graph.node_indexes[-1]))
-
+        chromosome = self._reporter._base_name.replace("_", "")
+        scored_paths = []
         for max_path in max_paths:
             assert max_path.length() >= 0, "Max path %s has negative length" % max_path
             if max_path.length() == 0:
                 logging.warning("Max path has 0 length: %s" % max_path)
                 max_path.set_score(float(0.0))
                 continue
+            scored_paths.append(max_path)
 
-            score = np.max(self.q_values.get_interval_values(max_path))
-            max_path.set_score(score)
-            max_path.chromosome = self._reporter._base_name.replace("_", "")
-            assert not np.isnan(score), "Score %s is nan" % score
-
-
+        scores, _, _ = get_peak_scores(scored_paths, self.q_values, self.graph)
+        assert not np.any(np.isnan(scores)), "Score is nan: %s" % scores
+        for max_path, score in zip(scored_paths, scores):
+            max_path.set_score(float(score))
+            max_path.chromosome = chromosome
 
         pairs = list(zip(max_paths, sub_graphs))
         pairs.sort(key=lambda p: p[0].score, reverse=True)
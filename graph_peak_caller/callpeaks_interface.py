@@ -8,16 +8,19 @@ from pyvg.conversion import vg_json_file_to_interval_collection
 from . import Configuration, CallPeaks
 from .multiplegraphscallpeaks import MultipleGraphsCallpeaks
 from .util import create_linear_map
-from .peakfasta import PeakFasta
+from .peakfasta import PeakFasta, SequenceIndex
 from .reporter import Reporter
-from .intervals import UniqueIntervals
+from .intervals import UniqueIntervals, ColumnarIntervals
 from .shiftestimation import MultiGraphShiftEstimator
 import sys
 
 
 def estimate_read_length(file_name, graph_name):
     graph = obg.Graph.from_file(graph_name)
-    if file_name.endswith(".intervalcollection"):
+    if ColumnarIntervals.is_columnar_file(file_name):
+        lengths = ColumnarIntervals.from_file(file_name).get_lengths(graph)
+        return int(np.median(lengths))
+    elif file_name.endswith(".intervalcollection"):
         intervals = obg.IntervalCollection.create_generator_from_file(
             file_name, graph=graph)
     else:
@@ -39,6 +42,34 @@ def get_confiugration(args):
     return config
 
 
+def get_n_workers(args):
+    n_workers = getattr(args, "n_workers", None)
+    return 1 if n_workers is None else int(n_workers)
+
+
+def get_resume(args):
+    return getattr(args, "resume", None) == "True"
+
+
+def get_profile(args):
+    return getattr(args, "profile", None) == "True"
+
+
+def get_text_all_max_paths(args):
+    return getattr(args, "text_all_max_paths", None) == "True"
+
+
+def get_sequence_cache_dir(args):
+    return getattr(args, "sequence_cache_dir", None)
+
+
+def set_background_cache(config, args):
+    cache_dir = getattr(args, "background_cache_dir", None)
+    if cache_dir is not None:
+        logging.info("Caching background tracks in %s" % cache_dir)
+        config.background_cache_dir = cache_dir
+
+
 def get_intervals(args):
     iclass = UniqueIntervals  # Use Intervals to skip filter dup
     samples = iclass(parse_input_file(args.sample, args.graph))
@@ -58,8 +89,10 @@ def get_callpeaks(args):
 def parse_input_file(input, graph):
     logging.info("Parsing input file %s" % input)
     try:
-        if isinstance(input, obg.IntervalCollection):
+        if isinstance(input, (obg.IntervalCollection, ColumnarIntervals)):
             return input
+        elif ColumnarIntervals.is_columnar_file(input):
+            return ColumnarIntervals.from_file(input)
         elif input.endswith(".json"):
             intervals = vg_json_file_to_interval_collection(input, graph)
             return intervals
@@ -154,8 +187,8 @@ def run_callpeaks2(args):
     logging.info("Using graphs: %s " % graphs)
     sequence_graph_file_names = [fn + ".sequences" for fn in graphs]
     logging.info("Will use sequence graphs. %s" % sequence_graph_file_names)
-    sequence_retrievers = (obg.SequenceGraph.from_file(fn)
-                           for fn in sequence_graph_file_names)
+    sequence_retrievers = (SequenceIndex.from_file(
+        fn, get_sequence_cache_dir(args)) for fn in sequence_graph_file_names)
 
     data_dir = os.path.dirname(graphs[0])
     if data_dir == "":
@@ -236,8 +269,10 @@ def run_callpeaks2(args):
         config.global_min = None
 
     out_name = args.out_name if args.out_name is not None else ""
-    reporter = Reporter(out_name)
+    reporter = Reporter(out_name, profile=get_profile(args),
+                        text_all_max_paths=get_text_all_max_paths(args))
     config.has_control = args.control is not None
+    set_background_cache(config, args)
     caller = MultipleGraphsCallpeaks(
         names,
         graphs,
@@ -247,6 +282,8 @@ def run_callpeaks2(args):
         config, reporter,
         sequence_retrievers=sequence_retrievers,
         stop_after_p_values=args.stop_after_p_values == "True",
+        n_workers=get_n_workers(args),
+        resume=get_resume(args)
     )
     caller.run()
 
@@ -278,11 +315,12 @@ def run_callpeaks_whole_genome(args):
 
 
     sequence_retrievers = \
-            (obg.SequenceGraph.from_file(args.data_dir + "/" + chrom + ".nobg.sequences")
+            (SequenceIndex.from_file(args.data_dir + "/" + chrom + ".nobg.sequences",
+                                     get_sequence_cache_dir(args))
              for chrom in chromosomes)
 
 
-    if args.sample.endswith(".intervalcollection"):
+    if args.sample.endswith((".intervalcollection", ".intervalarrays")):
         sample_file_names = [args.sample.replace("chrom", chrom) for chrom in chromosomes]
 
     else:
@@ -296,6 +334,9 @@ def run_callpeaks_whole_genome(args):
             control_file_names = [
                 args.control_reads_base_name.replace("chrom", chrom)
                 for chrom in chromosomes]
+        elif args.control.endswith(".intervalarrays"):
+            control_file_names = [args.control.replace("chrom", chrom)
+                                  for chrom in chromosomes]
         else:
             control_base_name = args.control.replace(".json", "_")
             control_file_names = [control_base_name + chrom + ".json"
@@ -322,8 +363,10 @@ def run_callpeaks_whole_genome(args):
                                                   int(genome_size)))
 
     out_name = args.out_name if args.out_name is not None else ""
-    reporter = Reporter(out_name)
+    reporter = Reporter(out_name, profile=get_profile(args),
+                        text_all_max_paths=get_text_all_max_paths(args))
     config.has_control = args.control is not None
+    set_background_cache(config, args)
     caller = MultipleGraphsCallpeaks(
         chromosomes,
         graph_file_names,
@@ -333,6 +376,8 @@ def run_callpeaks_whole_genome(args):
         config, reporter,
         sequence_retrievers=sequence_retrievers,
         stop_after_p_values=args.stop_after_p_values == "True",
+        n_workers=get_n_workers(args),
+        resume=get_resume(args)
     )
     caller.run()
 
@@ -343,7 +388,8 @@ def run_callpeaks_whole_genome_from_p_values(args):
     chromosomes = [chromosome]
     graph_file_names = [args.data_dir + chrom + ".nobg" for chrom in chromosomes]
     sequence_retrievers = \
-        (obg.SequenceGraph.from_file(args.data_dir + "/" + chrom + ".nobg.sequences") for chrom in chromosomes)
+        (SequenceIndex.from_file(args.data_dir + "/" + chrom + ".nobg.sequences",
+                                 get_sequence_cache_dir(args)) for chrom in chromosomes)
     out_name = args.out_name if args.out_name is not None else ""
     config = Configuration()
 
@@ -355,7 +401,8 @@ def run_callpeaks_whole_genome_from_p_values(args):
 
     config.fragment_length = int(args.fragment_length)
     config.read_length = int(args.read_length)
-    reporter = Reporter(out_name)
+    reporter = Reporter(out_name, profile=get_profile(args),
+                        text_all_max_paths=get_text_all_max_paths(args))
     caller = MultipleGraphsCallpeaks(
         chromosomes,
         graph_file_names,
@@ -367,5 +414,5 @@ def run_callpeaks_whole_genome_from_p_values(args):
         sequence_retrievers=sequence_retrievers,
         variant_maps_path=args.variant_maps_path
     )
-    caller.create_joined_q_value_mapping()
+    caller.create_joined_q_value_mapping(use_saved_table=True)
     caller.run_from_p_values(only_chromosome=chromosome)
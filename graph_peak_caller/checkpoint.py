@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+
+def describe_input(obj):
+    """Return a json-serializable description of a stage input, or
+    None if the input cannot be identified (e.g. reads in memory)"""
+    if isinstance(obj, np.ndarray):
+        return hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest()
+    if obj is None or isinstance(obj, (int, float, bool)):
+        return obj
+    if isinstance(obj, str):
+        if os.path.isdir(obj):
+            return [obj, _describe_directory(obj)]
+        if not os.path.isfile(obj):
+            return None
+        stat = os.stat(obj)
+        return [obj, stat.st_size, stat.st_mtime_ns]
+    return None
+
+
+def _describe_directory(dir_name):
+    """Name, size and modification time of all files in a directory,
+    e.g. the arrays of a .intervalarrays read set"""
+    files = []
+    for root, dir_names, file_names in os.walk(dir_name):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(root, file_name)
+            stat = os.stat(path)
+            files.append([os.path.relpath(path, dir_name),
+                          stat.st_size, stat.st_mtime_ns])
+    return files
+
+
+def get_fingerprint(inputs, config):
+    """Hash of the inputs and configuration of a stage.
+
+    Files are identified by name, size and modification time, and
+    directories by those of the files in them. Only the configuration
+    fields that affect the output (config.output_fields) are included.
+    Returns None if one of the inputs cannot be identified (e.g. a
+    missing file), in which case the stage is never skipped."""
+    descriptions = [describe_input(obj) for obj in inputs]
+    if any(d is None for d, obj in zip(descriptions, inputs)
+           if obj is not None):
+        return None
+    config = {key: repr(getattr(config, key, None))
+              for key in sorted(config.output_fields)}
+    return hashlib.sha1(
+        json.dumps([descriptions, config]).encode()).hexdigest()
+
+
+class StageManifest:
+    """Records which stages of the pipeline have been completed for
+    one graph, so that a rerun can skip stages whose outputs are still
+    valid. A stage is valid if it was run with the same inputs and
+    configuration, and its output files have not changed since."""
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self._stages = {}
+        if os.path.isfile(file_name):
+            with open(file_name) as f:
+                self._stages = json.load(f)
+
+    def is_done(self, stage, fingerprint):
+        if fingerprint is None or stage not in self._stages:
+            return False
+        entry = self._stages[stage]
+        if entry["fingerprint"] != fingerprint:
+            logging.info("Inputs to stage %s have changed" % stage)
+            return False
+        for file_name, description in entry["outputs"].items():
+            if description is None or \
+                    describe_input(file_name) != description:
+                logging.info("Output %s of stage %s has changed" % (
+                    file_name, stage))
+                return False
+        return True
+
+    def set_done(self, stage, fingerprint, outputs):
+        if fingerprint is None:
+            return
+        self._stages[stage] = {
+            "fingerprint": fingerprint,
+            "outputs": {name: describe_input(name) for name in outputs}}
+        self.to_file()
+
+    def to_file(self):
+        tmp_file_name = self._file_name + ".tmp%d" % os.getpid()
+        with open(tmp_file_name, "w") as f:
+            json.dump(self._stages, f, indent=1)
+        os.replace(tmp_file_name, self._file_name)
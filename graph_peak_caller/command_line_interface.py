@@ -11,6 +11,7 @@ import pickle
 from graph_peak_caller.peakcollection import Peak, PeakCollection
 from graph_peak_caller.sparsediffs import SparseValues
 from graph_peak_caller.mindense import DensePileup
+from graph_peak_caller.peakfasta import SequenceIndex
 
 
 from graph_peak_caller.callpeaks_interface import \
@@ -28,7 +29,8 @@ from graph_peak_caller.analysis.analysis_interface import analyse_peaks_whole_ge
 from graph_peak_caller.preprocess_interface import \
     count_unique_reads_interface, create_ob_graph,\
     create_linear_map_interface,\
-    split_vg_json_reads_into_chromosomes, shift_estimation
+    split_vg_json_reads_into_chromosomes, shift_estimation,\
+    alignments_to_arrays
 
 
 from offsetbasedgraph.interval import NoLinearProjectionException
@@ -179,6 +181,22 @@ interface = \
                     ('-q/--q_threshold', 'Optional. q-value threshold. Default is 0.05.'),
                     ('-M /--max_fold_enrichment', 'Optional. Maximum fold enrichment required for '
                                                'candidate peaks when estimating fragment length. Default 50.'),
+                    ('-w/--n_workers', 'Optional. Number of processes used to run multiple graphs '
+                                       'in parallel. Default 1. Largest graphs are started first.'),
+                    ('-B/--background_cache_dir', 'Optional. Directory used to cache background tracks, '
+                                                  'so that a control shared by several samples is only '
+                                                  'processed once.'),
+                    ('-R/--resume', 'Optional. Set to True in order to skip stages that were '
+                                    'completed by an earlier run with the same input and '
+                                    'configuration, e.g. after a crash.'),
+                    ('-P/--profile', 'Optional. Set to True in order to write time and memory '
+                                     'usage of each stage to [out_name][chromosome]_profile.json.'),
+                    ('-S/--sequence_cache_dir', 'Optional. Directory used to cache packed node '
+                                                'sequences, so that later runs do not need to '
+                                                'decompress the sequence graphs.'),
+                    ('-T/--text_all_max_paths', 'Optional. Set to True in order to also write all '
+                                                'max paths to [out_name][chromosome]_all_max_paths'
+                                                '.intervalcollection as text.'),
 
                 ],
                 'method': run_callpeaks2,
@@ -197,7 +215,13 @@ interface = \
                     ('-q/--q_threshold', 'Optional. q-value threshold. Default is 0.05.'),
                     ('-m/--variant_maps_path', 'Optional. Path where variant maps are stored. '
                                                'If set, variant maps will be used to try to improve max paths '
-                                               'through subgraphs (better handling of insertions and deletions)')
+                                               'through subgraphs (better handling of insertions and deletions)'),
+                    ('-S/--sequence_cache_dir', 'Optional. Directory used to cache packed node '
+                                                'sequences, so that later runs do not need to '
+                                                'decompress the sequence graphs.'),
+                    ('-T/--text_all_max_paths', 'Optional. Set to True in order to also write all '
+                                                'max paths to [out_name][chromosome]_all_max_paths'
+                                                '.intervalcollection as text.')
                 ],
             'method': run_callpeaks_whole_genome_from_p_values
         },
@@ -540,6 +564,18 @@ interface = \
                 ],
             'method': vg_json_alignments_to_intervals
         },
+    'alignments_to_arrays':
+        {
+            'help': 'Converts alignments to a columnar .intervalarrays directory, '
+                    'which is memory-mapped (and parsed much faster) when calling peaks',
+            'requires_graph': True,
+            'arguments':
+                [
+                    ('alignments_file_name', 'Vg json alignments (.json) or .intervalcollection file'),
+                    ('out_file_name', 'Out directory name. .intervalarrays is appended if missing.')
+                ],
+            'method': alignments_to_arrays
+        },
     'vg_json_alignments_to_fasta':
         {
             'help': 'Reads vg json alignments and converts to interval collection',
@@ -622,7 +658,7 @@ class GraphAction(argparse.Action):
         setattr(namespace, self.dest, new_values)
         setattr(namespace, "graph_file_name", values)
         try:
-            sequencegraph = obg.SequenceGraph.from_file(values + ".sequences")
+            sequencegraph = SequenceIndex.from_file(values + ".sequences")
             setattr(namespace, "sequence_graph", sequencegraph)
             logging.info("Using sequencegraph %s" % (values + ".sequences"))
         except FileNotFoundError:
@@ -2,6 +2,7 @@ import logging
 
 from .controlgenerator import SparseControl
 from .linearmap import LinearMap
+from .backgroundcache import BackgroundCache
 
 
 def get_background_track(graph, intervals, config, extensions,
@@ -10,6 +11,9 @@ def get_background_track(graph, intervals, config, extensions,
                        config.fragment_length, touched_nodes)
     if config.global_min is not None:
         sc.set_min_value(config.global_min)
+    if config.background_cache_dir is not None:
+        sc.set_cache(BackgroundCache(config.background_cache_dir,
+                                     config.background_cache_max_size))
     return sc.create(intervals)
 
 
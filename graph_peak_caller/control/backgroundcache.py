@@ -0,0 +1,83 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+from ..checkpoint import describe_input
+from .linearpileup import LinearPileup
+
+
+class BackgroundCache:
+    """On-disk cache of linear background pileups.
+
+    Entries are keyed by a hash of the control file and linear map file
+    (name, size and modification time) and the parameters used to
+    create the background, so that one control shared by many samples
+    is only read and processed once. The linear pileup is cached rather
+    than the graph track, since the graph track depends on the touched
+    nodes of each sample. The number of control reads is stored with it,
+    since it is needed to scale the tracks.
+
+    When the total size of the cache exceeds max_size bytes, the least
+    recently used entries are removed.
+    """
+    file_ending = ".background.npz"
+
+    def __init__(self, directory, max_size=10*1024**3):
+        self._directory = directory
+        self._max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(control_file_name, linear_map_file_name, extension_sizes,
+                fragment_length, min_value, is_unique):
+        """Key of a background track, or None if one of the files
+        cannot be identified"""
+        descriptions = [describe_input(control_file_name),
+                        describe_input(linear_map_file_name)]
+        if any(description is None for description in descriptions):
+            return None
+        return hashlib.sha1(json.dumps(
+            [descriptions, list(extension_sizes), fragment_length,
+             repr(min_value), is_unique]).encode()).hexdigest()
+
+    def _get_file_name(self, key):
+        return os.path.join(self._directory, key + self.file_ending)
+
+    def get(self, key):
+        """Return (linear pileup, min value, number of reads), or None
+        if not cached"""
+        file_name = self._get_file_name(key)
+        if not os.path.isfile(file_name):
+            return None
+        data = np.load(file_name)
+        os.utime(file_name)
+        logging.info("Using cached background track %s" % file_name)
+        return (LinearPileup(data["indices"], data["values"]),
+                float(data["min_value"]), int(data["n_reads"]))
+
+    def put(self, key, linear_pileup, min_value, n_reads):
+        file_name = self._get_file_name(key)
+        tmp_file_name = file_name + ".tmp%d" % os.getpid()
+        with open(tmp_file_name, "wb") as f:
+            np.savez(f, indices=linear_pileup.indices,
+                     values=linear_pileup.values, min_value=min_value,
+                     n_reads=n_reads)
+        os.replace(tmp_file_name, file_name)
+        logging.info("Wrote background track to cache %s" % file_name)
+        self._evict()
+
+    def _evict(self):
+        entries = [os.path.join(self._directory, name)
+                   for name in os.listdir(self._directory)
+                   if name.endswith(self.file_ending)]
+        entries = [(os.path.getmtime(name), os.path.getsize(name), name)
+                   for name in entries]
+        entries.sort(reverse=True)
+        total_size = 0
+        for _, size, name in entries:
+            total_size += size
+            if total_size > self._max_size:
+                logging.info("Removing %s from background cache" % name)
+                os.remove(name)
@@ -2,43 +2,81 @@ import numpy as np
 import logging
 
 from ..sparsediffs import SparseDiffs
+from ..intervals import ColumnarIntervals, UniqueIntervals
 from .linearpileup import LinearPileup
 from .linearmap import LinearMap
 
 
 class SparseControl:
     def __init__(self, linear_map, graph, extension_sizes, fragment_length, touched_nodes):
+        self._linear_map_name = linear_map
         self._linear_map = LinearMap.from_file(linear_map, graph)
         self._extension_sizes = extension_sizes
         self._fragment_length = fragment_length
         self._graph = graph
         self._min_value = None
         self._touched_nodes = touched_nodes
+        self._cache = None
 
     def set_min_value(self, value):
         self._min_value = value
 
+    def set_cache(self, cache):
+        self._cache = cache
+
     def create(self, reads):
-        mapped_reads = self._linear_map.map_interval_collection(reads)
+        key = None
+        if self._cache is not None:
+            key = self._cache.get_key(
+                getattr(reads, "file_name", None), self._linear_map_name,
+                self._extension_sizes, self._fragment_length,
+                self._min_value, isinstance(reads, UniqueIntervals))
+        if key is None:
+            lin_pileup = self._create_linear_pileup(self._get_reads(reads))
+        else:
+            lin_pileup = self._create_cached_linear_pileup(reads, key)
+        return lin_pileup.to_sparse_pileup(
+            self._linear_map, self._touched_nodes, self._min_value)
+
+    @staticmethod
+    def _get_reads(reads):
+        if isinstance(reads, UniqueIntervals):
+            return reads.get_unique()
+        return reads
+
+    def _create_cached_linear_pileup(self, reads, key):
+        """Use the cached linear pileup if there is one, in which case
+        the reads are never read. Their number is set from the cache"""
+        cached = self._cache.get(key)
+        if cached is not None:
+            lin_pileup, self._min_value, reads.n_reads = cached
+            return lin_pileup
+        lin_pileup = self._create_linear_pileup(self._get_reads(reads))
+        self._cache.put(key, lin_pileup, self._min_value, reads.n_reads)
+        return lin_pileup
+
+    def _create_linear_pileup(self, reads):
+        if isinstance(reads, ColumnarIntervals):
+            mapped_reads = self._linear_map.map_read_arrays(reads)
+        else:
+            mapped_reads = self._linear_map.map_interval_collection(reads)
         if self._min_value is None:
             self._min_value = mapped_reads.n_intervals*self._fragment_length / self._linear_map._length
         logging.info("Using min value %s", self._min_value)
-        max_pileup = None
+        extended_pileups = []
         for tmp_extension in self._extension_sizes:
             extension = tmp_extension // 2
             sparse_diffs = SparseDiffs.from_starts_and_ends(
                 mapped_reads.extend_np(extension))
             sparse_diffs /= (extension*2/self._fragment_length)
-            if max_pileup is None:
+            if not extended_pileups:
                 sparse_diffs.clip_min(self._min_value)
-                max_pileup = sparse_diffs
-            else:
-                max_pileup = max_pileup.maximum(sparse_diffs)
+            extended_pileups.append(sparse_diffs)
+        max_pileup = SparseDiffs.maximum_of(extended_pileups)
         max_pileup._sanitize()
         lin_pileup = LinearPileup(
             max_pileup._indices,
             np.cumsum(max_pileup._diffs))
         lin_pileup.sanitize_indices()
         lin_pileup.sanitize_values()
-        return lin_pileup.to_sparse_pileup(
-            self._linear_map, self._touched_nodes, self._min_value)
+        return lin_pileup
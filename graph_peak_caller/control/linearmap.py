@@ -1,5 +1,6 @@
 import numpy as np
 import logging
+import offsetbasedgraph as obg
 from .linearintervals import LinearIntervalCollection
 from ..sparsediffs import SparseDiffs
 
@@ -17,6 +18,59 @@ def get_reference_map(graph, reference_path):
     
 
 
+def get_edge_arrays(graph):
+    """Edges of the graph as arrays of from and to node indexes
+    (node id - min node)"""
+    adj_list = graph.adj_list
+    if isinstance(adj_list, obg.graph.AdjListAsNumpyArrays):
+        n_edges = adj_list._n_edges.astype("int64")
+        from_nodes = np.repeat(
+            np.arange(n_edges.size) + adj_list.node_id_offset, n_edges)
+        starts = adj_list._indices.astype("int64")
+        edge_idxs = np.arange(n_edges.sum()) + np.repeat(
+            starts - np.r_[0, np.cumsum(n_edges)[:-1]], n_edges)
+        to_nodes = adj_list._values[edge_idxs].astype("int64")
+    else:
+        from_nodes = np.array([node for node, edges in adj_list.items()
+                               for _ in edges], dtype="int64")
+        to_nodes = np.array([edge for edges in adj_list.values()
+                             for edge in edges], dtype="int64")
+    return from_nodes-graph.min_node, to_nodes-graph.min_node
+
+
+def find_max_dists(node_sizes, from_idxs, to_idxs, size):
+    """Longest distance from any source node to the start of each node.
+
+    Nodes are visited in topological order (Kahn's algorithm) on
+    CSR arrays of the edges, converted to lists so that the inner loop
+    does not go through the graph's python API.
+    """
+    n_nodes = node_sizes.size
+    args = np.argsort(from_idxs, kind="mergesort")
+    targets = to_idxs[args].tolist()
+    offsets = np.r_[0, np.cumsum(
+        np.bincount(from_idxs, minlength=n_nodes))].tolist()
+    in_degree = np.bincount(to_idxs, minlength=n_nodes)
+    stack = np.flatnonzero(in_degree == 0).tolist()
+    in_degree = in_degree.tolist()
+    sizes = node_sizes.tolist()
+    max_dists = [0]*size
+    n_processed = 0
+    while stack:
+        if n_processed % 500000 == 0:
+            logging.info("%d nodes processed" % n_processed)
+        n_processed += 1
+        node = stack.pop()
+        cur_dist = max_dists[node] + sizes[node]
+        for next_node in targets[offsets[node]:offsets[node+1]]:
+            if cur_dist > max_dists[next_node]:
+                max_dists[next_node] = cur_dist
+            in_degree[next_node] -= 1
+            if in_degree[next_node] == 0:
+                stack.append(next_node)
+    return np.array(max_dists, dtype="float")
+
+
 class LinearMap:
     def __init__(self, node_starts, node_ends, graph):
         self._node_starts = np.asanyarray(node_starts)
@@ -48,6 +102,23 @@ class LinearMap:
         offset = self.get_node_start(node_id)
         return scale, offset
 
+    def map_positions(self, node_ids, offsets):
+        """Linear positions of the graph positions given by arrays of
+        (signed) node ids and offsets"""
+        node_ids = np.asanyarray(node_ids)
+        idxs = np.abs(node_ids)-self._graph.min_node
+        node_starts = self._node_starts[idxs]
+        node_ends = self._node_ends[idxs]
+        node_sizes = np.diff(self._graph.node_indexes)[idxs]
+        scaled_offsets = (node_ends-node_starts) / node_sizes * offsets
+        return np.where(node_ids > 0, node_starts + scaled_offsets,
+                        node_ends - scaled_offsets)
+
+    def map_read_arrays(self, reads):
+        return LinearIntervalCollection(
+            self.map_positions(reads.start_nodes, reads.start_offsets),
+            self.map_positions(reads.end_nodes, reads.end_offsets))
+
     def map_interval_collection(self, interval_collection):
         starts = []
         ends = []
@@ -100,6 +171,18 @@ class LinearMap:
 
     @classmethod
     def from_graph(cls, graph):
+        logging.info("Finding starts and ends")
+        from_idxs, to_idxs = get_edge_arrays(graph)
+        node_sizes = np.diff(graph.node_indexes)
+        size = int(graph.get_sorted_node_ids()[-1])
+        starts = find_max_dists(node_sizes, from_idxs, to_idxs, size)
+        ends = find_max_dists(node_sizes, to_idxs, from_idxs, size)
+        linear_length = ends[0] + node_sizes[0]
+        return cls(starts, linear_length - ends, graph)
+
+    @classmethod
+    def from_graph_by_node_traversal(cls, graph):
+        """Slower reference version of from_graph"""
         logging.info("Getting topologically sorted nodes")
         node_ids = list(graph.get_topological_sorted_node_ids())
         logging.info("Finding starts and ends")
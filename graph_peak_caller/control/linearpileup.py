@@ -3,6 +3,8 @@ import logging
 from collections import defaultdict
 
 from ..eventsorter import EventSorter, EventSort
+from ..sparsediffs import SparseDiffs
+from ..touchednodes import TouchedNodes
 
 
 class UnmappedIndices(object):
@@ -54,6 +56,56 @@ class LinearPileup(object):
         return LinearPileup(es.indices, es.values)
 
     def to_sparse_pileup(self, linear_map, touched_nodes=None, min_value=0):
+        """Map the pileup back to the graph.
+
+        Each touched node gets the pileup value at its linear start and
+        the pileup changes inside its linear [start, end) range, scaled
+        to node offsets. Other nodes get min_value.
+        """
+        graph = linear_map._graph
+        node_indexes = graph.node_indexes
+        n_nodes = node_indexes.size-1
+        is_touched = np.ones(n_nodes, dtype="bool")
+        if isinstance(touched_nodes, TouchedNodes):
+            is_touched = touched_nodes.contains_many(
+                np.arange(n_nodes)+graph.min_node)
+        elif touched_nodes is not None:
+            is_touched[:] = False
+            touched = np.fromiter(touched_nodes, dtype="int64",
+                                  count=len(touched_nodes))
+            touched = touched - graph.min_node
+            is_touched[touched[(touched >= 0) & (touched < n_nodes)]] = True
+        starts = linear_map._node_starts[:n_nodes]
+        ends = linear_map._node_ends[:n_nodes]
+        # The first entry of each node is the last change at or before
+        # its start. Index 0 in the padded arrays is value 0 at 0
+        pileup_indices = np.r_[0, self.indices]
+        pileup_values = np.r_[0, self.values]
+        first = np.searchsorted(self.indices, starts, side="right")
+        last = np.searchsorted(self.indices, ends, side="left")
+        lens = np.where(is_touched, last-first+1, 1)
+        entry_node = np.repeat(np.arange(n_nodes), lens)
+        entry_idxs = np.arange(lens.sum()) + np.repeat(
+            first - np.r_[0, np.cumsum(lens)[:-1]], lens)
+        entry_touched = is_touched[entry_node]
+        entry_idxs = entry_idxs[entry_touched]
+        touched_node = entry_node[entry_touched]
+
+        scales = (ends-starts) / np.diff(node_indexes)
+        graph_indices = node_indexes[entry_node].astype("float")
+        graph_indices[entry_touched] = (
+            pileup_indices[entry_idxs]-starts[touched_node]) // \
+            scales[touched_node] + node_indexes[touched_node]
+        is_first = np.r_[0, np.cumsum(lens)[:-1]]
+        graph_indices[is_first] = np.maximum(
+            node_indexes[:-1], graph_indices[is_first])
+        values = np.full(entry_node.size, min_value, dtype="float")
+        values[entry_touched] = pileup_values[entry_idxs]
+        return SparseDiffs(graph_indices.astype("int"),
+                           np.diff(np.r_[0, values]))
+
+    def to_sparse_pileup_by_events(self, linear_map, touched_nodes=None,
+                                   min_value=0):
         logging.info("Getting event sorter")
         event_sorter = self.get_event_sorter(linear_map, touched_nodes)
         logging.info("Getting unmapped indices")
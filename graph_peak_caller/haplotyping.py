@@ -2,6 +2,8 @@ from offsetbasedgraph import IntervalCollection, Interval, NumpyIndexedInterval
 from collections import defaultdict
 from offsetbasedgraph import IndexedInterval
 import logging
+import numpy as np
+from .intervals import ColumnarIntervals
 
 
 class HaploTyper:
@@ -9,14 +11,21 @@ class HaploTyper:
     Simple naive haplotyper
     """
     def __init__(self, graph, intervals):
-        assert isinstance(intervals, IntervalCollection)
+        assert isinstance(intervals, (IntervalCollection, ColumnarIntervals))
         self.graph = graph
         self.intervals = intervals
 
         self.node_counts = defaultdict(int)
 
+    def _build_from_arrays(self):
+        region_paths = self.intervals.region_paths
+        node_ids, counts = np.unique(region_paths, return_counts=True)
+        self.node_counts.update(zip(node_ids.tolist(), counts.tolist()))
+
     def build(self):
         logging.info("Building haplotyper")
+        if isinstance(self.intervals, ColumnarIntervals):
+            return self._build_from_arrays()
         i = 0
         for interval in self.intervals.intervals:
             if i % 50000 == 0:
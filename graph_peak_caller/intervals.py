@@ -1,3 +1,10 @@
+import os
+import array
+import logging
+import numpy as np
+import offsetbasedgraph as obg
+
+
 class Intervals:
     def __init__(self, intervals):
         self._intervals = intervals
@@ -8,26 +15,219 @@ class Intervals:
         self.n_reads += 1
         return x
 
+    @property
+    def file_name(self):
+        return getattr(self._intervals, "file_name", None)
+
     def __iter__(self):
         for interval in self._intervals:
             self.n_reads += 1
             yield interval
 
 
+class LazyIntervals:
+    """Intervals in a file that is only read when they are first used,
+    so that a cached background track can be used without reading the
+    control reads. read_func(file_name) reads the intervals"""
+    def __init__(self, file_name, read_func):
+        self.file_name = file_name
+        self._read_func = read_func
+        self._intervals = None
+
+    def get_intervals(self):
+        if self._intervals is None:
+            self._intervals = self._read_func(self.file_name)
+        return self._intervals
+
+    def __iter__(self):
+        return iter(self.get_intervals())
+
+
+def get_unique_mask(keys):
+    """Boolean mask that is True for the first occurrence of each key"""
+    mask = np.zeros(keys.size, dtype="bool")
+    mask[np.unique(keys, return_index=True)[1]] = True
+    return mask
+
+
 class UniqueIntervals:
+    """Filters out reads sharing start position with an earlier read.
+
+    The reads are converted to ColumnarIntervals, so that duplicates
+    are found by np.unique on one int64 key per read instead of
+    keeping a hash of every read in a dict.
+    """
     def __init__(self, intervals):
         self._intervals = intervals
+        self._columnar = None
+        self._unique = None
         self.n_reads = 0
         self.n_duplicates = 0
 
+    @property
+    def file_name(self):
+        return getattr(self._intervals, "file_name", None)
+
+    def _get_columnar(self):
+        if self._columnar is None:
+            intervals = self._intervals
+            if isinstance(intervals, LazyIntervals):
+                intervals = intervals.get_intervals()
+            if isinstance(intervals, ColumnarIntervals):
+                self._columnar = intervals
+            else:
+                self._columnar = ColumnarIntervals.from_intervals(intervals)
+        return self._columnar
+
+    def get_keep_mask(self):
+        mask = get_unique_mask(self._get_columnar().get_start_keys())
+        self.n_duplicates = mask.size-np.count_nonzero(mask)
+        return mask
+
+    def get_unique(self):
+        if self._unique is None:
+            self._unique = self._get_columnar().get_subset(
+                self.get_keep_mask())
+            logging.info("Found %d duplicates" % self.n_duplicates)
+        self.n_reads = self._unique.n_reads
+        return self._unique
+
     def __iter__(self):
-        interval_hashes = {}
-        for interval in self._intervals:
-            _hash = interval.hash(ignore_end_pos=True)
-            if _hash in interval_hashes:
-                self.n_duplicates += 1
-                continue
+        return iter(self.get_unique())
 
-            interval_hashes[_hash] = True
-            self.n_reads += 1
-            yield interval
+
+class ColumnarIntervals:
+    """Reads stored as flat arrays instead of Interval objects.
+
+    region_paths holds the (signed) node ids of all reads concatenated,
+    and region_path_offsets[i]:region_path_offsets[i+1] is the slice
+    belonging to read i (CSR layout). Reverse reads have negative
+    node ids, as in offsetbasedgraph.
+
+    On disk the arrays are stored as .npy files in a directory
+    (by convention ending with .intervalarrays), so that they can be
+    memory-mapped when read.
+    """
+    file_names = ["region_paths", "region_path_offsets",
+                  "start_offsets", "end_offsets"]
+
+    def __init__(self, region_paths, region_path_offsets,
+                 start_offsets, end_offsets, start_keys=None, graph=None):
+        self.region_paths = np.asanyarray(region_paths)
+        self.region_path_offsets = np.asanyarray(region_path_offsets)
+        self.start_offsets = np.asanyarray(start_offsets)
+        self.end_offsets = np.asanyarray(end_offsets)
+        self._start_keys = start_keys
+        self.graph = graph
+        self.n_reads = self.start_offsets.size
+        self.n_duplicates = 0
+
+    def __len__(self):
+        return self.n_reads
+
+    @property
+    def start_nodes(self):
+        return self.region_paths[self.region_path_offsets[:-1]]
+
+    @property
+    def end_nodes(self):
+        return self.region_paths[self.region_path_offsets[1:]-1]
+
+    @property
+    def is_reverse(self):
+        return self.end_nodes < 0
+
+    @property
+    def n_region_paths(self):
+        return np.diff(self.region_path_offsets)
+
+    def get_start_keys(self):
+        """One int64 key per read identifying its start position.
+
+        (abs(node), strand, offset) is packed as node << 33 | strand << 32
+        | offset, which is unique as long as node ids are below 2**30.
+        """
+        if self._start_keys is None:
+            start_nodes = self.start_nodes.astype("int64")
+            self._start_keys = (np.abs(start_nodes) << 33) | (
+                (start_nodes < 0).astype("int64") << 32) | \
+                self.start_offsets.astype("int64")
+        return self._start_keys
+
+    def get_lengths(self, graph):
+        node_sizes = np.diff(graph.node_indexes).astype("int64")
+        rp_sizes = node_sizes[np.abs(self.region_paths)-graph.min_node]
+        total = np.add.reduceat(rp_sizes, self.region_path_offsets[:-1])
+        end_sizes = node_sizes[np.abs(self.end_nodes)-graph.min_node]
+        return total - self.start_offsets - (end_sizes - self.end_offsets)
+
+    def get_region_paths(self, i):
+        return self.region_paths[
+            self.region_path_offsets[i]:self.region_path_offsets[i+1]]
+
+    def get_subset(self, mask):
+        """Return a new ColumnarIntervals with the reads where mask is True"""
+        n_region_paths = self.n_region_paths
+        rp_mask = np.repeat(mask, n_region_paths)
+        start_keys = None
+        if self._start_keys is not None:
+            start_keys = self._start_keys[mask]
+        return self.__class__(
+            self.region_paths[rp_mask],
+            np.r_[0, np.cumsum(n_region_paths[mask])],
+            self.start_offsets[mask], self.end_offsets[mask],
+            start_keys=start_keys, graph=self.graph)
+
+    def __iter__(self):
+        for i in range(self.n_reads):
+            yield obg.Interval(int(self.start_offsets[i]),
+                               int(self.end_offsets[i]),
+                               [int(rp) for rp in self.get_region_paths(i)],
+                               graph=self.graph)
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        region_paths = array.array("q")
+        n_region_paths = array.array("q")
+        start_offsets = array.array("i")
+        end_offsets = array.array("i")
+        graph = None
+        for interval in intervals:
+            region_paths.extend(interval.region_paths)
+            n_region_paths.append(len(interval.region_paths))
+            start_offsets.append(interval.start_position.offset)
+            end_offsets.append(interval.end_position.offset)
+            graph = interval.graph
+        return cls(np.frombuffer(region_paths, dtype="int64"),
+                   np.r_[0, np.cumsum(np.frombuffer(n_region_paths,
+                                                    dtype="int64"))],
+                   np.frombuffer(start_offsets, dtype="int32"),
+                   np.frombuffer(end_offsets, dtype="int32"),
+                   graph=graph)
+
+    def to_file(self, file_name):
+        os.makedirs(file_name, exist_ok=True)
+        for name in self.file_names:
+            np.save(os.path.join(file_name, name + ".npy"),
+                    getattr(self, name))
+        np.save(os.path.join(file_name, "start_keys.npy"),
+                self.get_start_keys())
+        logging.info("Wrote %d reads to %s" % (self.n_reads, file_name))
+
+    @classmethod
+    def from_file(cls, file_name, mmap=True):
+        mmap_mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(file_name, name + ".npy"),
+                          mmap_mode=mmap_mode)
+                  for name in cls.file_names]
+        keys_file_name = os.path.join(file_name, "start_keys.npy")
+        start_keys = None
+        if os.path.isfile(keys_file_name):
+            start_keys = np.load(keys_file_name, mmap_mode=mmap_mode)
+        logging.info("Read %d reads from %s" % (arrays[2].size, file_name))
+        return cls(*arrays, start_keys=start_keys)
+
+    @staticmethod
+    def is_columnar_file(file_name):
+        return isinstance(file_name, str) and \
+            file_name.rstrip("/").endswith(".intervalarrays")
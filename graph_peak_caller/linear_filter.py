@@ -1,6 +1,8 @@
 from pyvg.conversion import vg_json_file_to_intervals
 import offsetbasedgraph as obg
 from graph_peak_caller.haplotyping import HaploTyper
+from graph_peak_caller.intervals import ColumnarIntervals
+import numpy as np
 import logging
 
 
@@ -59,3 +61,55 @@ class LinearFilter:
 
         return cls(positions, indexed_interval)
 
+    @classmethod
+    def from_reads_file_and_graph(cls, reads_file_name, graph_file_name):
+        if ColumnarIntervals.is_columnar_file(reads_file_name):
+            return ColumnarLinearFilter.from_columnar_reads_and_graph(
+                reads_file_name, graph_file_name)
+        return cls.from_vg_json_reads_and_graph(
+            reads_file_name, graph_file_name)
+
+
+class ColumnarLinearFilter(LinearFilter):
+    def __init__(self, reads, indexed_interval, graph):
+        super().__init__(None, indexed_interval)
+        self._reads = reads
+        self._graph = graph
+
+    def find_start_positions(self):
+        logging.info("Mapping graph position to linear positions")
+        path = self._indexed_interval
+        path_nodes = np.array(path.region_paths)
+        node_ids = self._reads.start_nodes
+        offsets = self._reads.start_offsets.astype("int64")
+        abs_node_ids = np.abs(node_ids)
+        n_nodes = max(path_nodes.max(), abs_node_ids.max(initial=0))+1
+        path_dists = np.zeros(n_nodes, dtype="int64")
+        path_dists[path_nodes] = [path.distance_to_node[node]
+                                  for node in path_nodes]
+        path_dists[path_nodes[0]] -= path.start_position.offset
+        is_path_node = np.zeros(n_nodes, dtype="bool")
+        is_path_node[path_nodes] = True
+        dists = path_dists[abs_node_ids]
+        in_path = is_path_node[abs_node_ids]
+        node_sizes = np.diff(self._graph.node_indexes).astype("int64")
+        is_reverse = node_ids < 0
+        pos = in_path & ~is_reverse
+        neg = in_path & is_reverse
+        start_positions = {
+            "+": dists[pos] + offsets[pos],
+            "-": dists[neg] + node_sizes[
+                abs_node_ids[neg]-self._graph.min_node] - offsets[neg]}
+        logging.info("Found in total %d positions" % start_positions["+"].size)
+        return start_positions
+
+    @classmethod
+    def from_columnar_reads_and_graph(cls, reads_file_name, graph_file_name):
+        logging.info("Reading graph %s" % graph_file_name)
+        graph = obg.GraphWithReversals.from_numpy_file(graph_file_name)
+        reads = ColumnarIntervals.from_file(reads_file_name)
+        logging.info("Getting indexed interval through graph")
+        haplotyper = HaploTyper(graph, reads)
+        haplotyper.build()
+        indexed_interval = haplotyper.get_maximum_interval_through_graph()
+        return cls(reads, indexed_interval, graph)
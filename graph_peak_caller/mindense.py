@@ -1,4 +1,5 @@
 import numpy as np
+from .peakcollection import get_linear_ranges
 
 
 class DensePileup:
@@ -25,39 +26,26 @@ class DensePileup:
     def get_interval_values(self, interval):
         interval_length = interval.length()
         assert interval_length > 0, "Trying to get value of interval with negative length, %s" % interval
-        values = np.zeros(interval_length)
-        offset = 0
-
-        is_reverse = False
-        if interval.region_paths[0] < 0:
-            assert np.all(np.array(interval.region_paths) < 0), " First region path negative, but not rest. Interval: %s" % interval
-            is_reverse = True
-            interval = interval.get_reverse()
-
-        for i, rp in enumerate(interval.region_paths):
-            assert rp > 0, "Currently only implemented for forward directed intervals"
-            start = 0
-            end = self._graph.node_size(rp)
-            if i == 0:
-                start = interval.start_position.offset
-            if i == len(interval.region_paths) - 1:
-                end = interval.end_position.offset
-
-            assert end > start, "Start >= end for interval %s" % interval
-            values_in_rp = self.values_in_range(rp, start, end)
-            values[offset:offset + (end - start)] = values_in_rp
-
-            offset += end-start
-
-
-        if is_reverse:
-            out = values[::-1]
-        else:
-            out = values
-
+        values, _ = self.get_intervals_values([interval])
         assert np.sum(np.isnan(values)) == 0, "%s contains nan" % (values)
         return values
 
+    def get_intervals_values(self, intervals):
+        """Values of many intervals as one ragged array. Returns the
+        concatenated values and the offsets of each interval into
+        them, so that interval i has values[offsets[i]:offsets[i+1]].
+        Reverse intervals are handled as in get_interval_values"""
+        starts, ends, interval_ids = get_linear_ranges(intervals, self._graph)
+        lengths = ends-starts
+        assert np.all(lengths > 0), "Empty range in %s" % intervals
+        range_offsets = np.r_[0, np.cumsum(lengths)]
+        positions = np.arange(range_offsets[-1]) + np.repeat(
+            starts-range_offsets[:-1], lengths)
+        values = self._values[positions]
+        interval_starts = np.searchsorted(
+            interval_ids, np.arange(len(intervals)+1))
+        return values, range_offsets[interval_starts]
+
     def __str__(self):
         out = "Minimum DensePileup. Values: %s. Sum: %.3f" % (self._values, np.sum(self._values))
         return out
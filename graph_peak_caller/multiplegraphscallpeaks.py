@@ -1,13 +1,20 @@
+import os
 import numpy as np
 import logging
+from concurrent.futures import ProcessPoolExecutor
 import offsetbasedgraph as obg
 from pyvg.conversion import vg_json_file_to_interval_collection
 from . import CallPeaks
-from .sparsepvalues import PToQValuesMapper
+from .sparsepvalues import PToQValuesMapper, PToQTable
 from .sparsediffs import SparseValues
-from .intervals import Intervals, UniqueIntervals
+from .intervals import Intervals, UniqueIntervals, ColumnarIntervals, \
+    LazyIntervals, get_unique_mask
 
 from .peakfasta import PeakFasta
+from .peakcollection import PeakCollection
+from .checkpoint import StageManifest, get_fingerprint
+from .touchednodes import TouchedNodes
+from .profiling import profiled
 from offsetbasedgraph import NumpyIndexedInterval
 
 
@@ -20,7 +27,9 @@ class MultipleGraphsCallpeaks:
                  sequence_retrievers=None,
                  stop_after_p_values=False,
                  linear_path_file_names=None,
-                 variant_maps_path=None
+                 variant_maps_path=None,
+                 n_workers=1,
+                 resume=False
                  ):
         self._config = config
         self._reporter = reporter
@@ -33,31 +42,31 @@ class MultipleGraphsCallpeaks:
         self.stop_after_p_values = stop_after_p_values
         self.linear_path_file_names=linear_path_file_names
         self.variant_maps_path = variant_maps_path
+        self.n_workers = n_workers
+        self.resume = resume
 
         if self.stop_after_p_values:
             logging.info("Will only run until p-values have been computed.")
 
+    def __getstate__(self):
+        # The sequence retrievers are a generator, and are only used
+        # in the main process
+        state = self.__dict__.copy()
+        state["sequence_retrievers"] = None
+        return state
+
     @classmethod
     def count_number_of_unique_reads(cls, sample_reads):
         n_unique = 0
         for reads in sample_reads:
             logging.info("Processing sample")
-
-            interval_hashes = set()
-            n_duplicates = 0
-            i = 0
-            for interval in reads.intervals:
-                if i % 20000 == 0:
-                    logging.info("%d reads processed" % i)
-                i += 1
-                hash = interval.hash(ignore_end_pos=True)
-                if hash in interval_hashes:
-                    n_duplicates += 1
-                else:
-                    n_unique += 1
-                interval_hashes.add(hash)
-
-            logging.info("Found %d duplicates" % n_duplicates)
+            if not isinstance(reads, ColumnarIntervals):
+                reads = ColumnarIntervals.from_intervals(reads.intervals)
+            keep_mask = get_unique_mask(reads.get_start_keys())
+            n_sample_unique = np.count_nonzero(keep_mask)
+            logging.info("Found %d duplicates" % (
+                keep_mask.size - n_sample_unique))
+            n_unique += n_sample_unique
 
         logging.info("In total %d unique reads" % n_unique)
         return n_unique
@@ -72,99 +81,235 @@ class MultipleGraphsCallpeaks:
         if self.stop_after_p_values:
             logging.info("Stopping, as planned, after p-values")
             return
-        self.create_joined_q_value_mapping()
+        self.create_joined_q_value_mapping(use_saved_table=self.resume)
         self.run_from_p_values()
 
+    def _get_base_name(self, i):
+        name = self.names[i]
+        if name != "":
+            name += "_"
+        return self._reporter._base_name + name
+
+    def _get_manifest(self, i):
+        return StageManifest(self._get_base_name(i) + "manifest.json")
+
+    def _get_stage_inputs(self, i, stage):
+        if stage == "p_values":
+            return [self.graph_file_names[i], self.samples[i],
+                    self.controls[i], self.linear_maps[i]]
+        base_name = self._get_base_name(i)
+        inputs = [self.graph_file_names[i],
+                  base_name + "pvalues_indexes.npy",
+                  base_name + "pvalues_values.npy",
+                  base_name + "touched_nodes.npy",
+                  self._q_value_mapping.p_values,
+                  self._q_value_mapping.q_values,
+                  self.variant_maps_path]
+        if self.linear_path_file_names is not None:
+            inputs.append(self.linear_path_file_names[i])
+        return inputs
+
+    def _get_stage_outputs(self, i, stage):
+        base_name = self._get_base_name(i)
+        if stage == "p_values":
+            return [base_name + "pvalues_indexes.npy",
+                    base_name + "pvalues_values.npy",
+                    base_name + "pvalues_histogram.npz",
+                    base_name + "touched_nodes.npy"]
+        return [base_name + "max_paths.intervalcollection",
+                base_name + "max_paths.peaks.npz"]
+
+    def _get_stage_fingerprint(self, i, stage):
+        return get_fingerprint(self._get_stage_inputs(i, stage),
+                               self._config)
+
+    def _is_stage_done(self, i, stage):
+        if not self.resume:
+            return False
+        is_done = self._get_manifest(i).is_done(
+            stage, self._get_stage_fingerprint(i, stage))
+        if is_done:
+            logging.info("Skipping %s for %s, already done" % (
+                stage, self.names[i]))
+        return is_done
+
+    def _set_stage_done(self, i, stage):
+        if not self.resume:
+            return
+        self._get_manifest(i).set_done(
+            stage, self._get_stage_fingerprint(i, stage),
+            self._get_stage_outputs(i, stage))
+
+    def _read_intervals(self, file_name, graph):
+        """Read intervals from file_name, choosing the reader from its
+        ending. Intervals already in memory are returned as they are"""
+        if not isinstance(file_name, str):
+            return file_name
+        elif ColumnarIntervals.is_columnar_file(file_name):
+            return ColumnarIntervals.from_file(file_name)
+        elif file_name.endswith(".intervalcollection"):
+            try:
+                return obg.IntervalCollection.from_file(
+                    file_name, graph=graph)
+            except OSError:
+                return obg.IntervalCollection.from_file(
+                    file_name, graph=graph, text_file=True)
+        logging.info("Creating interval collection from %s" % file_name)
+        return vg_json_file_to_interval_collection(file_name, graph)
+
     def get_intervals(self, sample, control, graph):
-        if isinstance(sample, Intervals) or isinstance(sample, UniqueIntervals):
+        if isinstance(sample, (Intervals, UniqueIntervals)):
             logging.info("Sample is already intervalcollection.")
             return sample, control
-        elif sample.endswith(".intervalcollection"):
-            try:
-                sample = obg.IntervalCollection.from_file(
-                    sample, graph=graph)
-            except OSError:
-                sample = obg.IntervalCollection.from_file(
-                    sample, graph=graph, text_file=True)
-            try:
-                control = obg.IntervalCollection.from_file(
-                    control, graph=graph)
-            except:
-                control = obg.IntervalCollection.from_file(
-                    control, graph=graph, text_file=True)
+        sample = self._read_intervals(sample, graph)
+        if isinstance(control, str) and \
+                self._config.background_cache_dir is not None:
+            # Only read if the background track is not cached
+            control = LazyIntervals(
+                control, lambda file_name: self._read_intervals(
+                    file_name, graph))
         else:
-            logging.info("Creating interval collections from files")
-            sample = vg_json_file_to_interval_collection(sample, graph)
-            control = vg_json_file_to_interval_collection(control, graph)
+            control = self._read_intervals(control, graph)
 
         if self._config.keep_duplicates:
             logging.warning("Keeping duplicates. Should only be used for testing.")
-            return Intervals(sample), Intervals(control)
+            return tuple(
+                intervals if isinstance(intervals, ColumnarIntervals)
+                else Intervals(intervals) for intervals in (sample, control))
         else:
             return UniqueIntervals(sample), UniqueIntervals(control)
 
-    def run_to_p_values(self):
-        for name, graph_file_name, sample, control, lin_map in \
-            zip(self.names, self.graph_file_names,
-                self.samples, self.controls, self.linear_maps):
-            logging.info("Running to p values, %s" % name)
-            ob_graph = obg.Graph.from_file(
-                graph_file_name)
-            sample, control = self.get_intervals(sample, control, ob_graph)
-            config = self._config.copy()
-            config.linear_map_name = lin_map
-            caller = CallPeaks(ob_graph, config,
-                               self._reporter.get_sub_reporter(name))
+    def _get_scheduling_order(self, indexes):
+        """Largest graphs first, so that the big chromosomes are not
+        left running alone at the end"""
+        return sorted(
+            indexes, reverse=True,
+            key=lambda i: os.path.getsize(self.graph_file_names[i]))
+
+    def _map_chromosomes(self, func, indexes):
+        if self.n_workers <= 1 or len(indexes) <= 1:
+            return {i: func(i) for i in indexes}
+        indexes = self._get_scheduling_order(indexes)
+        n_workers = min(self.n_workers, len(indexes))
+        logging.info("Running %d chromosomes using %d processes" % (
+            len(indexes), n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {i: executor.submit(func, i) for i in indexes}
+            return {i: future.result() for i, future in futures.items()}
+
+    def _run_to_p_values(self, i):
+        name = self.names[i]
+        logging.info("Running to p values, %s" % name)
+        ob_graph = obg.Graph.from_file(
+            self.graph_file_names[i])
+        sample, control = self.get_intervals(
+            self.samples[i], self.controls[i], ob_graph)
+        config = self._config.copy()
+        config.linear_map_name = self.linear_maps[i]
+        reporter = self._reporter.get_sub_reporter(name)
+        with reporter.stage("run_to_p_values"):
+            caller = CallPeaks(ob_graph, config, reporter)
             caller.run_to_p_values(sample, control)
-            logging.info("Done until p values.")
-            logging.info("In total %d duplicates were removed from sample" % sample.n_duplicates)
+        logging.info("Done until p values.")
+        logging.info("In total %d duplicates were removed from sample" % sample.n_duplicates)
+        self._set_stage_done(i, "p_values")
 
-    def create_joined_q_value_mapping(self):
-        mapper = PToQValuesMapper.from_files(self._reporter._base_name)
-        self._q_value_mapping = mapper.get_p_to_q_values()
+    def run_to_p_values(self):
+        indexes = [i for i in range(len(self.names))
+                   if not self._is_stage_done(i, "p_values")]
+        self._map_chromosomes(self._run_to_p_values, indexes)
 
-    def run_from_p_values(self, only_chromosome=None):
-        for i, name in enumerate(self.names):
-            logging.info("Name: %s" % name)
-            if only_chromosome is not None:
-                if only_chromosome != name:
-                    logging.info("Skipping %s" % str(name))
-                    continue
-            graph_file_name = self.graph_file_names[i]
-            ob_graph = obg.Graph.from_numpy_file(
-                graph_file_name)
-
-            variant_maps = None
-            if self.variant_maps_path is not None:
-                from offsetbasedgraph.vcfmap import load_variant_maps
-                logging.info("Will use variant maps when calling peaks (in max path finding)")
-                variant_maps = load_variant_maps(name, self.variant_maps_path)
-
-            linear_path = None
-            if self.linear_path_file_names is not None:
-                linear_path = NumpyIndexedInterval.from_file(self.linear_path_file_names[i])
-
-            assert ob_graph is not None
-            caller = CallPeaks(ob_graph, self._config,
-                               self._reporter.get_sub_reporter(name),
+    @profiled("joined_q_value_mapping")
+    def create_joined_q_value_mapping(self, use_saved_table=False):
+        base_name = self._reporter._base_name
+        if use_saved_table and PToQValuesMapper.has_up_to_date_table(base_name):
+            logging.info("Using saved p to q-value table")
+            self._q_value_mapping = PToQTable.from_file(base_name)
+            return
+        mapper = PToQValuesMapper.from_files(base_name)
+        self._q_value_mapping = mapper.get_p_to_q_table()
+        self._q_value_mapping.to_file(base_name)
+
+    def _run_from_p_values(self, i):
+        name = self.names[i]
+        logging.info("Name: %s" % name)
+        graph_file_name = self.graph_file_names[i]
+        ob_graph = obg.Graph.from_numpy_file(
+            graph_file_name)
+
+        variant_maps = None
+        if self.variant_maps_path is not None:
+            from offsetbasedgraph.vcfmap import load_variant_maps
+            logging.info("Will use variant maps when calling peaks (in max path finding)")
+            variant_maps = load_variant_maps(name, self.variant_maps_path)
+
+        linear_path = None
+        if self.linear_path_file_names is not None:
+            linear_path = NumpyIndexedInterval.from_file(self.linear_path_file_names[i])
+
+        assert ob_graph is not None
+        reporter = self._reporter.get_sub_reporter(name)
+        with reporter.stage("run_from_p_values"):
+            caller = CallPeaks(ob_graph, self._config, reporter,
                                variant_maps=variant_maps)
             caller.p_to_q_values_mapping = self._q_value_mapping
             if name != "":
                 name += "_"
             caller.p_values_pileup = SparseValues.from_sparse_files(
                 self._reporter._base_name + name + "pvalues")
-            caller.touched_nodes = set(np.load(
-                self._reporter._base_name + name + "touched_nodes.npy"))
+            caller.touched_nodes = TouchedNodes.from_file(
+                self._reporter._base_name + name + "touched_nodes.npy",
+                ob_graph.min_node)
             caller.get_q_values()
             caller.call_peaks_from_q_values(linear_path)
-            if self.sequence_retrievers is not None:
-                try:
-                    sequencegraph = self.sequence_retrievers.__next__()
-                except FileNotFoundError:
-                    logging.warning("Could not find sequence graphs. Will not store max paths.")
-                    continue
-
-                PeakFasta(sequencegraph).write_max_path_sequences(
-                  self._reporter._base_name + name + "sequences.fasta", caller.max_path_peaks)
-                #caller.save_max_path_sequences_to_fasta_file(
-                #    "sequences.fasta", self.sequence_retrievers.__next__())
+        self._set_stage_done(i, "peaks")
+        return caller.max_path_peaks
+
+    def _run_from_p_values_in_worker(self, i):
+        # Max paths hold a reference to the graph, so they are read
+        # back from the max_paths file instead of being returned
+        self._run_from_p_values(i)
+
+    def _write_max_path_sequences(self, i, max_paths=None):
+        if self.sequence_retrievers is None:
+            return
+        try:
+            sequencegraph = self.sequence_retrievers.__next__()
+        except FileNotFoundError:
+            logging.warning("Could not find sequence graphs. Will not store max paths.")
+            return
+        name = self.names[i]
+        if name != "":
+            name += "_"
+        base_name = self._reporter._base_name + name
+        if max_paths is None:
+            if os.path.isfile(base_name + "max_paths.peaks.npz"):
+                max_paths = PeakCollection.from_peaks_file(
+                    base_name + "max_paths.peaks.npz")
+            else:
+                max_paths = PeakCollection.from_file(
+                    base_name + "max_paths.intervalcollection", text_file=True)
+        PeakFasta(sequencegraph).write_max_path_sequences(
+            base_name + "sequences.fasta", max_paths)
+
+    def run_from_p_values(self, only_chromosome=None):
+        indexes = []
+        for i, name in enumerate(self.names):
+            if only_chromosome is not None and only_chromosome != name:
+                logging.info("Skipping %s" % str(name))
+                continue
+            indexes.append(i)
+        done = {i for i in indexes if self._is_stage_done(i, "peaks")}
+        remaining = [i for i in indexes if i not in done]
+
+        if self.n_workers <= 1 or len(remaining) <= 1:
+            for i in indexes:
+                max_paths = None
+                if i not in done:
+                    max_paths = self._run_from_p_values(i)
+                self._write_max_path_sequences(i, max_paths)
+            return
+
+        self._map_chromosomes(self._run_from_p_values_in_worker, remaining)
+        for i in indexes:
+            self._write_max_path_sequences(i)
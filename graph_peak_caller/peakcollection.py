@@ -4,7 +4,39 @@ import logging
 from collections import defaultdict
 import numpy as np
 from .analysis.nongraphpeaks import NonGraphPeakCollection, NonGraphPeak
-from .summits import find_summits
+
+
+def get_linear_ranges(intervals, graph):
+    """Linear ranges [starts, ends) of the nodes covered by each
+    interval, and the index of the interval of each range.
+    Reverse intervals are given by the ranges of their reverse"""
+    intervals = [interval.get_reverse() if interval.region_paths[0] < 0
+                 else interval for interval in intervals]
+    n_nodes = np.array([len(interval.region_paths) for interval in intervals],
+                       dtype="int")
+    if not intervals:
+        return np.zeros(0, dtype="int"), np.zeros(0, dtype="int"), \
+            np.zeros(0, dtype="int")
+    nodes = np.concatenate(
+        [interval.region_paths for interval in intervals]).astype("int")
+    assert np.all(nodes > 0), "Mixed directions in %s" % intervals
+    node_idxs = nodes - graph.min_node
+    starts = graph.node_indexes[node_idxs].astype("int")
+    ends = graph.node_indexes[node_idxs+1].astype("int")
+    last_idxs = np.cumsum(n_nodes)-1
+    first_idxs = last_idxs-n_nodes+1
+    ends[last_idxs] = starts[last_idxs] + [
+        interval.end_position.offset for interval in intervals]
+    starts[first_idxs] += [
+        interval.start_position.offset for interval in intervals]
+    return starts, ends, np.repeat(np.arange(len(intervals)), n_nodes)
+
+
+def get_peak_scores(peaks, q_values, graph):
+    """Max q-value, mean q-value and summit offset of each peak,
+    calculated directly from the SparseValues q_values"""
+    starts, ends, peak_ids = get_linear_ranges(peaks, graph)
+    return q_values.get_interval_scores(starts, ends, peak_ids)
 
 
 class Peak(obg.DirectedInterval):
@@ -97,41 +129,22 @@ class Peak(obg.DirectedInterval):
 class PeakCollection(obg.IntervalCollection):
     interval_class = Peak
 
-    def cut_around_summit_super(self, q_values, linear_ref, n_base_pairs_around=60):
-
-        def get_super_summit(peak, linear_ref):
-            peak_qvalues = q_values.get_interval_values(peak)
-            max_positions = np.flatnonzero(peak_qvalues == np.max(peak_qvalues))
-            summit_position = np.partition(max_positions, max_positions.size//2)[max_positions.size//2]
-            return peak.get_superinterval(summit_position, n_base_pairs_around, linear_ref)
-
-        self.intervals = [get_super_summit(peak, linear_ref) for peak in self.intervals]
+    def cut_around_summit_super(self, q_values, graph, linear_ref,
+                                n_base_pairs_around=60):
+        _, _, summits = get_peak_scores(self.intervals, q_values, graph)
+        self.intervals = [
+            peak.get_superinterval(int(summit), n_base_pairs_around, linear_ref)
+            for peak, summit in zip(self.intervals, summits)]
         for peak in self.intervals:
             assert peak.length() <= n_base_pairs_around * 2
 
-
-    def cut_around_summit(self, q_values, n_base_pairs_around=60):
-        def get_summit(peak):
-            peak_qvalues = q_values.get_interval_values(peak)
-            max_positions = np.flatnonzero(peak_qvalues == np.max(peak_qvalues))
-            summit_position = np.partition(max_positions, max_positions.size//2)[max_positions.size//2]
-            return peak.get_subinterval(
-                max(0, summit_position - n_base_pairs_around),
-                min(summit_position + n_base_pairs_around, peak.length()))
-
-
-        def get_summit_fancy(peak):
-            peak_qvalues = q_values.get_interval_values(peak)
-            summits = find_summits(peak_qvalues)
-            if not summits.size:
-                return get_summit(peak)
-            summit_values = peak_qvalues[summits]
-            summit_position = summits[np.argmax(summit_values)]
-            return peak.get_subinterval(
-                max(0, summit_position - n_base_pairs_around),
-                min(summit_position + n_base_pairs_around, peak.length()))
-
-        self.intervals = [get_summit(peak) for peak in self.intervals]
+    def cut_around_summit(self, q_values, graph, n_base_pairs_around=60):
+        _, _, summits = get_peak_scores(self.intervals, q_values, graph)
+        self.intervals = [
+            peak.get_subinterval(
+                max(0, summit - n_base_pairs_around),
+                min(summit + n_base_pairs_around, peak.length()))
+            for peak, summit in zip(self.intervals, summits)]
         for peak in self.intervals:
             assert peak.length() <= n_base_pairs_around * 2
 
@@ -251,6 +264,64 @@ class PeakCollection(obg.IntervalCollection):
 
         return NonGraphPeakCollection(linear_peaks)
 
+    def to_peaks_file(self, file_name):
+        """Write the peaks as arrays to a binary .npz file: offsets,
+        scores, flags (1: is_diff, 2: is_ambigous), chromosome codes
+        and the region paths of all peaks in CSR form"""
+        peaks = list(self.intervals)
+        n_nodes = np.array([len(p.region_paths) for p in peaks], dtype="int")
+        chromosomes = [p.chromosome for p in peaks]
+        chromosome_names = sorted({c for c in chromosomes if c is not None})
+        chromosome_codes = {name: i for i, name in enumerate(chromosome_names)}
+        flags = np.array([int(bool(p.info[0])) | 2*int(bool(p.info[1]))
+                          for p in peaks], dtype="uint8")
+        region_paths = np.concatenate(
+            [np.asanyarray(p.region_paths, dtype="int") for p in peaks]) \
+            if peaks else np.zeros(0, dtype="int")
+        with open(file_name, "wb") as f:
+            np.savez(
+                f,
+                starts=np.array([p.start_position.offset for p in peaks],
+                                dtype="int"),
+                ends=np.array([p.end_position.offset for p in peaks],
+                              dtype="int"),
+                directions=np.array([p.direction for p in peaks],
+                                    dtype="int8"),
+                scores=np.array([p.score for p in peaks], dtype="float"),
+                flags=flags,
+                unique_ids=np.array([str(p.unique_id) for p in peaks],
+                                    dtype="str"),
+                chromosome_names=np.array(chromosome_names, dtype="str"),
+                chromosome_codes=np.array(
+                    [chromosome_codes.get(c, -1) for c in chromosomes],
+                    dtype="int"),
+                node_offsets=np.r_[0, np.cumsum(n_nodes)],
+                region_paths=region_paths)
+        logging.info("Wrote %d peaks to %s" % (len(peaks), file_name))
+        return file_name
+
+    @classmethod
+    def from_peaks_file(cls, file_name, graph=None):
+        data = np.load(file_name)
+        chromosome_names = list(data["chromosome_names"]) + [None]
+        node_offsets = data["node_offsets"].tolist()
+        region_paths = data["region_paths"].tolist()
+        flags = data["flags"].tolist()
+        peaks = []
+        for i, (start, end, direction, score, unique_id, code) in enumerate(
+                zip(data["starts"].tolist(), data["ends"].tolist(),
+                    data["directions"].tolist(), data["scores"].tolist(),
+                    data["unique_ids"].tolist(),
+                    data["chromosome_codes"].tolist())):
+            peak = Peak(start, end,
+                        region_paths[node_offsets[i]:node_offsets[i+1]],
+                        graph=graph, direction=direction, score=score,
+                        unique_id=unique_id,
+                        chromosome=chromosome_names[code])
+            peak.info = (flags[i] & 1, flags[i] >> 1)
+            peaks.append(peak)
+        return cls(peaks)
+
     def to_fasta_file(self, file_name, sequence_graph):
         from .peakfasta import PeakFasta
         PeakFasta(sequence_graph).save_intervals(file_name, self)
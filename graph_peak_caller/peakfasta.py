@@ -1,30 +1,189 @@
+import os
+import hashlib
 import logging
+import numpy as np
+import offsetbasedgraph as obg
+
+
+class SequenceIndex:
+    """Node sequences of a graph packed as 2-bit base codes (a, c, t, g)
+    and a 1-bit mask of n's, for extracting the sequences of many
+    intervals at once.
+
+    from_file can keep the packed arrays as uncompressed files in
+    cache_dir, so that later runs can memory-map them instead of
+    decompressing the whole sequence graph. No files are written
+    unless cache_dir is given."""
+    _letters = np.frombuffer(b"actgn", dtype="uint8")
+    _complements = np.array([2, 3, 0, 1, 4], dtype="uint8")
+    _cache_version = 1
+
+    def __init__(self, node_id_offset, indices, bases, n_mask):
+        self._node_id_offset = int(node_id_offset)
+        self._indices = np.asanyarray(indices, dtype="int")
+        self._bases = bases
+        self._n_mask = n_mask
+
+    @classmethod
+    def from_sequence_array(cls, node_id_offset, indices, sequence_array):
+        """sequence_array holds the letter codes of obg.SequenceGraph
+        (0: n, 1: a, 2: c, 3: t, 4: g)"""
+        sequence_array = np.asanyarray(sequence_array)
+        is_n = (sequence_array == 0) | (sequence_array > 4)
+        codes = np.where(is_n, 0, sequence_array-1).astype("uint8")
+        codes = np.r_[codes, np.zeros(-codes.size % 4, dtype="uint8")]
+        codes = codes.reshape(-1, 4)
+        bases = (codes[:, 0] << 6) | (codes[:, 1] << 4) | \
+            (codes[:, 2] << 2) | codes[:, 3]
+        return cls(node_id_offset, indices, bases, np.packbits(is_n))
+
+    @classmethod
+    def from_sequence_graph(cls, sequence_graph):
+        return cls.from_sequence_array(sequence_graph._node_id_offset,
+                                       sequence_graph._indices,
+                                       sequence_graph._sequence_array)
+
+    @staticmethod
+    def _get_cache_names(file_name, cache_dir):
+        path_hash = hashlib.sha1(
+            os.path.abspath(file_name).encode()).hexdigest()[:12]
+        base_name = os.path.join(
+            cache_dir, os.path.basename(file_name) + "." + path_hash)
+        return (base_name + ".index.npz", base_name + ".bases.npy",
+                base_name + ".nmask.npy")
+
+    @classmethod
+    def _get_source_description(cls, file_name):
+        stat = os.stat(file_name)
+        return np.array([stat.st_size, stat.st_mtime_ns, cls._cache_version])
+
+    @classmethod
+    def from_file(cls, file_name, cache_dir=None):
+        if cache_dir is None:
+            return cls.from_sequence_graph(
+                obg.SequenceGraph.from_file(file_name))
+        index_name, bases_name, n_mask_name = cls._get_cache_names(
+            file_name, cache_dir)
+        if all(os.path.isfile(name)
+               for name in (index_name, bases_name, n_mask_name)):
+            index = np.load(index_name)
+            if np.array_equal(index["source"],
+                              cls._get_source_description(file_name)):
+                logging.info("Using cached sequence index %s" % index_name)
+                return cls(index["node_id_offset"], index["indices"],
+                           np.load(bases_name, mmap_mode="r"),
+                           np.load(n_mask_name, mmap_mode="r"))
+        obj = cls.from_sequence_graph(obg.SequenceGraph.from_file(file_name))
+        try:
+            obj.to_cache(file_name, cache_dir)
+        except OSError as e:
+            logging.warning("Could not cache sequence index: %s" % e)
+        return obj
+
+    def to_cache(self, file_name, cache_dir):
+        """Write the packed arrays to cache_dir. The index is written
+        last, since it marks the cache as valid for file_name"""
+        os.makedirs(cache_dir, exist_ok=True)
+        index_name, bases_name, n_mask_name = self._get_cache_names(
+            file_name, cache_dir)
+        tmp_ending = ".tmp%d" % os.getpid()
+        with open(bases_name + tmp_ending, "wb") as f:
+            np.save(f, self._bases)
+        with open(n_mask_name + tmp_ending, "wb") as f:
+            np.save(f, self._n_mask)
+        with open(index_name + tmp_ending, "wb") as f:
+            np.savez(f, source=self._get_source_description(file_name),
+                     node_id_offset=self._node_id_offset,
+                     indices=self._indices)
+        os.replace(bases_name + tmp_ending, bases_name)
+        os.replace(n_mask_name + tmp_ending, n_mask_name)
+        os.replace(index_name + tmp_ending, index_name)
+        logging.info("Wrote sequence index to %s" % index_name)
+
+    def _get_codes(self, positions):
+        """Base codes at positions (0: a, 1: c, 2: t, 3: g, 4: n)"""
+        codes = (self._bases[positions >> 2] >> (6-2*(positions & 3))) & 3
+        is_n = (self._n_mask[positions >> 3] >> (7-(positions & 7))) & 1
+        codes[is_n.astype("bool")] = 4
+        return codes
+
+    def get_sequences(self, intervals):
+        """Sequences of all the intervals, gathered with one index
+        operation. Reverse nodes give the reverse complement"""
+        n_nodes = np.array([len(i.region_paths) for i in intervals],
+                           dtype="int")
+        if not n_nodes.size:
+            return []
+        nodes = np.concatenate(
+            [i.region_paths for i in intervals]).astype("int")
+        node_idxs = np.abs(nodes)-self._node_id_offset
+        node_starts = self._indices[node_idxs]
+        node_sizes = self._indices[node_idxs+1]-node_starts
+        last_idxs = np.cumsum(n_nodes)-1
+        first_idxs = last_idxs-n_nodes+1
+        # Offsets in the direction of each node
+        starts = np.zeros(nodes.size, dtype="int")
+        ends = node_sizes.copy()
+        starts[first_idxs] = [i.start_position.offset for i in intervals]
+        ends[last_idxs] = [i.end_position.offset for i in intervals]
+        lengths = ends-starts
+        is_reverse = nodes < 0
+        first_pos = np.where(is_reverse, node_starts+node_sizes-1-starts,
+                             node_starts+starts)
+        steps = np.where(is_reverse, -1, 1)
+
+        range_offsets = np.r_[0, np.cumsum(lengths)]
+        positions = np.repeat(first_pos, lengths) + \
+            np.repeat(steps, lengths) * (
+                np.arange(range_offsets[-1]) -
+                np.repeat(range_offsets[:-1], lengths))
+        codes = self._get_codes(positions)
+        reverse_positions = np.repeat(is_reverse, lengths)
+        codes[reverse_positions] = self._complements[codes[reverse_positions]]
+        text = self._letters[codes].tobytes().decode()
+        offsets = range_offsets[np.r_[first_idxs, nodes.size]].tolist()
+        return [text[start:end] for start, end in
+                zip(offsets[:-1], offsets[1:])]
 
 
 class PeakFasta:
+    chunk_size = 10000
+
     def __init__(self, sequence_retriever):
+        if isinstance(sequence_retriever, obg.SequenceGraph):
+            sequence_retriever = SequenceIndex.from_sequence_graph(
+                sequence_retriever)
         self._sequence_retriever = sequence_retriever
 
-    def write_max_path_sequences(self, file_name, max_paths):
-        f = open(file_name, "w")
+    def _get_sequences(self, intervals):
+        if isinstance(self._sequence_retriever, SequenceIndex):
+            return self._sequence_retriever.get_sequences(intervals)
+        return [self._sequence_retriever.get_interval_sequence(interval)
+                for interval in intervals]
+
+    def _write_fasta(self, file_name, intervals):
+        """Write the intervals and their sequences in chunks, so that
+        sequences are extracted in bulk without holding all of them"""
+        intervals = iter(intervals)
         i = 0
-        for max_path in max_paths:
-            seq = self._sequence_retriever.get_interval_sequence(max_path)
-            f.write(">peak" + str(i) + " " +
-                    max_path.to_file_line() + "\n" + seq + "\n")
-            i += 1
-        f.close()
+        with open(file_name, "w") as f:
+            while True:
+                chunk = [interval for _, interval in
+                         zip(range(self.chunk_size), intervals)]
+                if not chunk:
+                    break
+                sequences = self._get_sequences(chunk)
+                f.write("".join(
+                    ">peak%d %s\n%s\n" % (i+j, interval.to_file_line(), seq)
+                    for j, (interval, seq) in enumerate(zip(chunk, sequences))))
+                i += len(chunk)
+                logging.info("Wrote %d sequences" % i)
+        return i
+
+    def write_max_path_sequences(self, file_name, max_paths):
+        self._write_fasta(file_name, max_paths)
         logging.info("Wrote max path sequences to fasta file: %s" %
                      (file_name))
 
     def save_intervals(self, out_fasta_file_name, interval_collection):
-        f = open(out_fasta_file_name, "w")
-        i = 0
-        for max_path in interval_collection.intervals:
-            seq = self._sequence_retriever.get_interval_sequence(max_path)
-            f.write(">peak" + str(i) + " " +
-                    max_path.to_file_line() + "\n" + seq + "\n")
-            i += 1
-            if i % 10000 == 0:
-                logging.info("Writing sequence # %d" % i)
-        f.close()
+        self._write_fasta(out_fasta_file_name, interval_collection.intervals)
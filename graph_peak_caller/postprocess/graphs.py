@@ -1,9 +1,174 @@
 import logging
-from itertools import chain
 import scipy.sparse.csgraph as csgraph
 import numpy as np
 from scipy.sparse import csr_matrix
+from offsetbasedgraph.graph import AdjListAsNumpyArrays
 from .subgraphanalyzer import SubGraphAnalyzer
+from ..touchednodes import TouchedNodes
+
+
+def get_row_edges(matrix, rows):
+    """Return the positions in matrix.indices/data of the edges going out
+    of the given rows, together with the row of each edge"""
+    starts = matrix.indptr[rows]
+    lengths = matrix.indptr[rows+1]-starts
+    edge_rows = np.repeat(rows, lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths)-lengths, lengths)
+    return np.repeat(starts, lengths)+offsets, edge_rows
+
+
+def get_topological_levels(matrix):
+    """Divide the nodes of the graph given by the csr matrix into levels,
+    such that every edge goes from a lower to a higher level. Returns
+    None if the graph has a cycle"""
+    in_degree = np.bincount(matrix.indices, minlength=matrix.shape[0])
+    level = np.flatnonzero(in_degree == 0)
+    levels = []
+    n_processed = 0
+    while level.size:
+        levels.append(level)
+        n_processed += level.size
+        edges, _ = get_row_edges(matrix, level)
+        targets = matrix.indices[edges]
+        np.subtract.at(in_degree, targets, 1)
+        targets = np.unique(targets)
+        level = targets[in_degree[targets] == 0]
+    if n_processed < matrix.shape[0]:
+        return None
+    return levels
+
+
+def get_dists_from(matrix, level_edges, sources, weights):
+    """Shortest distance from any of the sources to each node, found by
+    one pass over the edges of each topological level. Allows negative
+    weights"""
+    dists = np.full(matrix.shape[0], np.inf)
+    dists[sources] = 0
+    for edges, rows in level_edges:
+        np.minimum.at(dists, matrix.indices[edges],
+                      dists[rows]+weights[edges])
+    return dists
+
+
+def get_dists_to(matrix, level_edges, target, weights):
+    """Shortest distance from each node to target, found by one pass
+    over the topological levels in reverse order"""
+    dists = np.full(matrix.shape[0], np.inf)
+    dists[target] = 0
+    for edges, rows in reversed(level_edges):
+        np.minimum.at(dists, rows,
+                      dists[matrix.indices[edges]]+weights[edges])
+    return dists
+
+
+def get_shortest_dists(matrix, start_nodes, end_node):
+    """Find the shortest distance from any of the start nodes to each
+    node, and from each node to the end node, in the graph given by
+    the csr matrix. Uses one pass in topological order when the graph
+    is acyclic"""
+    levels = get_topological_levels(matrix)
+    if levels is None:
+        logging.warning("Line graph has cycles. Using Dijkstra")
+        to_dist = csgraph.dijkstra(matrix, indices=start_nodes,
+                                   min_only=True)
+        from_dist = csgraph.dijkstra(matrix.T.tocsr(), indices=end_node)
+        return to_dist, from_dist
+    level_edges = [get_row_edges(matrix, level) for level in levels]
+    return (get_dists_from(matrix, level_edges, start_nodes, matrix.data),
+            get_dists_to(matrix, level_edges, end_node, matrix.data))
+
+
+class Components:
+    """Nodes and sub-matrices of the connected components of a graph.
+    The component labels are sorted once, and the csr matrix is permuted
+    once so that each component is a contiguous block of rows. If
+    end_node is given, edges to it are kept as edges to an extra last
+    node in each sub-matrix"""
+
+    def __init__(self, matrix, labels, n_components, end_node=None):
+        self._n_components = n_components
+        self._order = np.argsort(labels, kind="mergesort")
+        sizes = np.bincount(labels, minlength=n_components)
+        self._offsets = np.r_[0, np.cumsum(sizes)]
+        self._end_node = end_node
+        local_idxs = np.zeros(matrix.shape[1], dtype="int")
+        local_idxs[self._order] = np.arange(labels.size) - np.repeat(
+            self._offsets[:-1], sizes)
+        rows = matrix[self._order]
+        local_idxs = local_idxs[rows.indices]
+        if end_node is not None:
+            is_end = rows.indices == end_node
+            row_labels = np.repeat(labels[self._order], np.diff(rows.indptr))
+            local_idxs[is_end] = sizes[row_labels[is_end]]
+        self._data = rows.data
+        self._indices = local_idxs
+        self._indptr = rows.indptr
+
+    def __len__(self):
+        return self._n_components
+
+    def get_nodes(self, comp):
+        return self._order[self._offsets[comp]:self._offsets[comp+1]]
+
+    def get_matrix(self, comp):
+        start, end = self._offsets[comp], self._offsets[comp+1]
+        first, last = self._indptr[start], self._indptr[end]
+        indptr = self._indptr[start:end+1]-first
+        size = end-start
+        if self._end_node is not None:
+            indptr = np.r_[indptr, last-first]
+            size += 1
+        return csr_matrix((self._data[first:last],
+                           self._indices[first:last],
+                           indptr), shape=(size, size))
+
+
+def get_adjacent_nodes(adj_list, node_ids):
+    """Edges of the given nodes in adj_list, as the index in node_ids of
+    the node each edge goes out from, and the node it goes to. Works on
+    both dict and numpy backed adjacency lists"""
+    node_ids = np.asanyarray(node_ids, dtype="int")
+    if not isinstance(adj_list, AdjListAsNumpyArrays):
+        adjs = [adj_list.get(node_id, []) for node_id in node_ids.tolist()]
+        rows = np.repeat(np.arange(node_ids.size),
+                         [len(adj) for adj in adjs])
+        return rows, np.array([a for adj in adjs for a in adj], dtype="int")
+    idxs = node_ids - adj_list.node_id_offset
+    is_valid = (idxs >= 0) & (idxs < adj_list._indices.size)
+    lengths = np.zeros(node_ids.size, dtype="int")
+    lengths[is_valid] = adj_list._n_edges[idxs[is_valid]]
+    starts = np.zeros(node_ids.size, dtype="int")
+    starts[is_valid] = adj_list._indices[idxs[is_valid]]
+    rows = np.repeat(np.arange(node_ids.size), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths)-lengths, lengths)
+    positions = np.repeat(starts, lengths) + offsets
+    return rows, adj_list._values[positions].astype("int")
+
+
+class NodeMask:
+    """Boolean mask for membership of node ids in a set of nodes"""
+
+    def __init__(self, node_ids):
+        node_ids = np.asanyarray(node_ids, dtype="int")
+        self._offset = node_ids.min() if node_ids.size else 0
+        self._mask = np.zeros(
+            node_ids.max()-self._offset+1 if node_ids.size else 0,
+            dtype="bool")
+        self._mask[node_ids-self._offset] = True
+
+    def contains_many(self, node_ids):
+        idxs = node_ids-self._offset
+        is_valid = (idxs >= 0) & (idxs < self._mask.size)
+        result = np.zeros(node_ids.size, dtype="bool")
+        result[is_valid] = self._mask[idxs[is_valid]]
+        return result
+
+
+def any_per_node(rows, values, n_nodes):
+    """For each node, whether values is True for any of its edges"""
+    return np.bincount(rows[values], minlength=n_nodes) > 0
 
 
 class DummyTouched:
@@ -11,6 +176,22 @@ class DummyTouched:
         return True
 
 
+class AllNodes:
+    def contains_many(self, node_ids):
+        return np.ones(node_ids.size, dtype="bool")
+
+
+def get_touched_mask(touched_nodes):
+    """NodeMask of a set of touched node ids, or AllNodes if every
+    node counts as touched. TouchedNodes are used as they are"""
+    if isinstance(touched_nodes, DummyTouched):
+        return AllNodes()
+    if isinstance(touched_nodes, TouchedNodes):
+        return touched_nodes
+    return NodeMask(np.fromiter(touched_nodes, dtype="int",
+                                count=len(touched_nodes)))
+
+
 class StubsFilter:
     def __init__(self, starts, fulls, ends, graph,
                  last_node=None, touched_nodes=None):
@@ -44,26 +225,32 @@ class StubsFilter:
         self._start_ends = np.flatnonzero(
             self.find_sub_ends(self.filtered_starts))
 
+    def _get_touched_mask(self):
+        return get_touched_mask(self._touched_nodes)
+
     def find_sub_starts(self, nodes):
-        r = np.array([not all(-adj in self._pos_from_nodes or -adj
-                              not in self._touched_nodes
-                              for adj in self._graph.reverse_adj_list[-node])
-                      for node in nodes], dtype="bool")
-        return r
+        rows, adjs = get_adjacent_nodes(self._graph.reverse_adj_list,
+                                        -np.asanyarray(nodes, dtype="int"))
+        is_inside = self._pos_from_nodes.contains_many(-adjs) | \
+            ~self._touched_mask.contains_many(-adjs)
+        return any_per_node(rows, ~is_inside, len(nodes))
 
     def find_sub_ends(self, nodes):
-        a = np.array([not all(adj in self._pos_to_nodes or adj > self._last_node or adj not in self._touched_nodes
-                              for adj in self._graph.adj_list[node])
-                      for node in nodes], dtype="bool")
-        return a
+        rows, adjs = get_adjacent_nodes(self._graph.adj_list, nodes)
+        is_inside = self._pos_to_nodes.contains_many(adjs) | \
+            ~self._touched_mask.contains_many(adjs)
+        if self._last_node is not None:
+            is_inside |= adjs > self._last_node
+        return any_per_node(rows, ~is_inside, len(nodes))
 
     def _get_start_filter(self, nodes):
-        return np.array([len(self._graph.reverse_adj_list[-node_id])
-                         for node_id in nodes], dtype="bool")
+        rows, _ = get_adjacent_nodes(self._graph.reverse_adj_list,
+                                     -np.asanyarray(nodes, dtype="int"))
+        return np.bincount(rows, minlength=len(nodes)) > 0
 
     def _get_ends_filter(self, nodes):
-        return np.array([len(self._graph.adj_list[node_id])
-                         for node_id in nodes], dtype="bool")
+        rows, _ = get_adjacent_nodes(self._graph.adj_list, nodes)
+        return np.bincount(rows, minlength=len(nodes)) > 0
 
     def filter_start_stubs(self):
         """ Locate nodes that are start_nodes of graph"""
@@ -75,25 +262,27 @@ class StubsFilter:
         self._fulls_mask &= self._get_ends_filter(self._fulls)
 
     def _set_pos_nodes(self):
-        self._pos_to_nodes = set(chain(self._fulls, self._ends))
-        self._pos_from_nodes = set(chain(self._starts, self._fulls))
+        self._pos_to_nodes = NodeMask(np.r_[self._fulls, self._ends])
+        self._pos_from_nodes = NodeMask(np.r_[self._starts, self._fulls])
+        self._touched_mask = self._get_touched_mask()
 
 
 class PosStubFilter(StubsFilter):
 
     def _set_pos_nodes(self):
-        self._pos_to_nodes = set(chain(self._fulls, self._ends))
-        self._pos_from_nodes = set(chain(self._starts, self._fulls))
+        self._pos_to_nodes = NodeMask(np.r_[self._fulls, self._ends])
+        self._pos_from_nodes = NodeMask(np.r_[self._starts, self._fulls])
 
     def find_sub_starts(self, nodes):
-        return np.array([not any(-adj in self._pos_from_nodes
-                                 for adj in self._graph.reverse_adj_list[-int(node)])
-                         for node in nodes], dtype="bool")
+        rows, adjs = get_adjacent_nodes(self._graph.reverse_adj_list,
+                                        -np.asanyarray(nodes, dtype="int"))
+        return ~any_per_node(rows, self._pos_from_nodes.contains_many(-adjs),
+                             len(nodes))
 
     def find_sub_ends(self, nodes):
-        return np.array([not any(adj in self._pos_to_nodes
-                                 for adj in self._graph.adj_list[int(node)])
-                         for node in nodes], dtype="bool")
+        rows, adjs = get_adjacent_nodes(self._graph.adj_list, nodes)
+        return ~any_per_node(rows, self._pos_to_nodes.contains_many(adjs),
+                             len(nodes))
 
     def filter_start_stubs(self):
         """ Locate nodes that are start_nodes of graph"""
@@ -157,32 +346,29 @@ class LineGraph:
     def make_graph(self):
         n_starts = self.start_nodes.size
         n_ends = self.end_nodes.size
-        to_nodes_dict = {node: n_starts+i for i, node in
-                         enumerate(self._all_nodes[n_starts:])}
         self.end_stub = self._all_nodes.size
-        from_nodes = []
-        to_nodes = []
-        sizes = []
-        possible_to_nodes = set(list(self._all_nodes[n_starts:]))
-        for i, node_id in enumerate(self._all_nodes[:self._all_nodes.size-n_ends]):
-            adj_nodes = self.ob_graph.adj_list[node_id]
-            next_nodes = [to_nodes_dict[node] for node in
-                          adj_nodes if node in possible_to_nodes]
-            from_nodes.extend([i]*len(next_nodes))
-            to_nodes.extend(next_nodes)
-            sizes.extend([self._all_sizes[i]]*len(next_nodes))
+        possible_to_nodes = self._all_nodes[n_starts:]
+        args = np.argsort(possible_to_nodes, kind="mergesort")
+        sorted_to_nodes = possible_to_nodes[args]
+        rows, adjs = get_adjacent_nodes(
+            self.ob_graph.adj_list,
+            self._all_nodes[:self._all_nodes.size-n_ends])
+        idxs = np.searchsorted(sorted_to_nodes, adjs, side="right")-1
+        is_valid = idxs >= 0
+        is_valid[is_valid] = sorted_to_nodes[idxs[is_valid]] == adjs[is_valid]
+        from_nodes = rows[is_valid]
+        to_nodes = n_starts + args[idxs[is_valid]]
 
         end_nodes = np.r_[self.filtered._start_ends,
                           n_starts + self.filtered._full_ends,
                           np.arange(self.n_nodes-n_ends, self.n_nodes)]
-        to_nodes.extend([self.end_stub]*end_nodes.size)
-        from_nodes.extend(list(end_nodes))
-        sizes.extend(self._all_sizes[end_nodes])
-        # self.n_starts = n_starts
+        from_nodes = np.r_[from_nodes, end_nodes]
+        to_nodes = np.r_[to_nodes, np.full(end_nodes.size, self.end_stub)]
+        sizes = self._all_sizes[from_nodes]
         self._graph_node_sizes = sizes
-        return csr_matrix((np.array(sizes, dtype="int32"),
-                           (np.array(from_nodes, dtype="int32"),
-                            np.array(to_nodes, dtype="int32"))),
+        return csr_matrix((sizes.astype("int32"),
+                           (from_nodes.astype("int32"),
+                            to_nodes.astype("int32"))),
                           [self.end_stub+1, self.end_stub+1])
 
     def get_masked(self, mask):
@@ -210,10 +396,8 @@ class LineGraph:
                             self.n_nodes-self.n_ends+self.filtered._end_starts]
         if not start_nodes.size:
             return np.array([], dtype="bool")
-        connected_components = csgraph.connected_components(self._matrix)
-        shortest_paths = csgraph.shortest_path(self._matrix)
-        to_dist = np.min(shortest_paths[start_nodes], axis=0)
-        from_dist = shortest_paths[:, self.end_stub]
+        to_dist, from_dist = get_shortest_dists(
+            self._matrix, start_nodes, self.end_stub)
         return (to_dist+from_dist)[:-1] > max_size
 
 
@@ -230,6 +414,21 @@ class DividedLinegraph(LineGraph):
         return sub_matrix
 
     def filter_small(self, max_size):
+        """Mask of the holes that are part of a path of holes longer
+        than max_size. Since paths never leave a component, the distances
+        are found for all components at once"""
+        start_nodes = np.r_[np.arange(self.n_starts),
+                            self.n_starts+self.filtered._full_starts,
+                            self.n_nodes-self.n_ends+self.filtered._end_starts]
+        if not start_nodes.size:
+            return np.ones_like(self._all_nodes, dtype="bool")
+        to_dist, from_dist = get_shortest_dists(
+            self._matrix, start_nodes, self.end_stub)
+        return (to_dist+from_dist)[:-1] > max_size
+
+    def filter_small_by_components(self, max_size):
+        """Old version of filter_small, using all-pairs shortest paths
+        in each component. Components larger than 36 nodes are kept"""
         start_nodes = np.r_[np.arange(self.n_starts),
                             self.n_starts+self.filtered._full_starts,
                             self.n_nodes-self.n_ends+self.filtered._end_starts]
@@ -237,8 +436,6 @@ class DividedLinegraph(LineGraph):
             return np.ones_like(self._all_nodes, dtype="bool")
         start_nodes_mask = np.zeros(self.end_stub, dtype="bool")
         start_nodes_mask[start_nodes] = True
-        if not start_nodes.size:
-            return np.array([], dtype="bool")
         n_components, connected_components = csgraph.connected_components(
             self._matrix[:self.end_stub, :self.end_stub])
         logging.info("Found %s components", n_components)
@@ -283,38 +480,110 @@ class PosDividedLineGraph(DividedLinegraph):
         return path
 
     def get_connected_components(self):
+        start_nodes = np.r_[np.arange(self.n_starts),
+                            self.n_starts+self.filtered._full_starts,
+                            self.n_nodes-self.n_ends+self.filtered._end_starts]
+        if not start_nodes.size:
+            return [], []
+        matrix = self._matrix[:self.end_stub, :self.end_stub]
+        n_components, connected_components = csgraph.connected_components(
+            matrix)
+        logging.info("Found %s components", n_components)
+        components = Components(-matrix, connected_components, n_components)
+        return ([components.get_nodes(comp) for comp in range(n_components)],
+                [components.get_matrix(comp) for comp in range(n_components)])
+
+    def _get_next_nodes(self, from_dist, weights):
+        """For each node, the first successor on a max path to the end"""
+        matrix = self._matrix
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        is_max = from_dist[matrix.indices]+weights == from_dist[rows]
+        max_rows, first = np.unique(rows[is_max], return_index=True)
+        next_nodes = np.full(matrix.shape[0], -1)
+        next_nodes[max_rows] = matrix.indices[is_max][first]
+        return next_nodes
+
+    def _get_best_starts(self, start_nodes, from_dist, connected_components,
+                         n_components):
+        """The start node with the best path in each component. Ties go to
+        the lowest index"""
+        start_components = connected_components[start_nodes]
+        args = np.lexsort((start_nodes, from_dist[start_nodes],
+                           start_components))
+        first = np.r_[True, np.diff(start_components[args]) != 0]
+        best_starts = np.full(n_components, -1)
+        best_starts[start_components[args][first]] = start_nodes[args][first]
+        return best_starts
+
+    def _follow_path(self, start, next_nodes, from_dist):
+        """The path from start to the end stub following next_nodes, or
+        None if there is no start or the end cannot be reached"""
+        if start < 0 or not np.isfinite(from_dist[start]):
+            return None
+        path = [start]
+        while next_nodes[path[-1]] != self.end_stub:
+            if next_nodes[path[-1]] < 0 or len(path) > self.end_stub:
+                return None
+            path.append(next_nodes[path[-1]])
+        return np.array(path)
+
+    def max_paths(self):
+        """Find the max path in each component. Since the line graph is a
+        DAG, the max paths for all components are found by one pass in
+        topological order, instead of all-pairs Bellman-Ford"""
         start_nodes = np.r_[np.arange(self.n_starts),
                             self.n_starts+self.filtered._full_starts,
                             self.n_nodes-self.n_ends+self.filtered._end_starts]
         if not start_nodes.size:
             return [], [], []
-        start_nodes_mask = np.zeros(self.end_stub, dtype="bool")
-        start_nodes_mask[start_nodes] = True
-        self._matrix.data += 1
+        levels = get_topological_levels(self._matrix)
+        if levels is None:
+            logging.warning("Line graph has cycles. Using Bellman-Ford")
+            return self.max_paths_by_bellman_ford()
+        level_edges = [get_row_edges(self._matrix, level) for level in levels]
+        weights = -self._matrix.data.astype("float")
+        from_dist = get_dists_to(self._matrix, level_edges,
+                                 self.end_stub, weights)
         n_components, connected_components = csgraph.connected_components(
             self._matrix[:self.end_stub, :self.end_stub])
         logging.info("Found %s components", n_components)
-        
-        # args = np.argsort(connected_components)
-        # diffs = np.r_[-1, np.flatnonzero(np.diff(connected_components[args]), args.size-1]
-        # component_dict = {i+1: args[diffs[i]+1:diffs[i+1]+1 for i in range(0, len(diffs)-1)}}
-        # component_dict[0] = args[:diffs[0]]
-        components = []
+        best_starts = self._get_best_starts(
+            start_nodes, from_dist, connected_components, n_components)
+        to_dist = get_dists_from(self._matrix, level_edges,
+                                 best_starts[best_starts >= 0], weights)
+        next_nodes = self._get_next_nodes(from_dist, weights)
+        components = Components(-self._matrix, connected_components,
+                                n_components, self.end_stub)
+        paths = []
+        infos = []
         subgraphs = []
         for comp in range(n_components):
-            idxs = np.flatnonzero(connected_components == comp)
-            subgraph = -self._matrix[idxs][:, idxs]
-            subgraph.data = subgraph.data + 1
-            components.append(idxs)
-            subgraphs.append(subgraph)
-        return components, subgraphs
-    # return {comp: np.flatnonzero(connected_components == comp) for comp in range(n_components)}
-    # subgraph = -self._matrix[idxs][:, idxs]
-    # subgraph.data = subgraph.data + 1
-
-                
+            if comp % 100 == 0:
+                logging.info("Component %s of %s", comp, n_components)
+            idxs = np.r_[components.get_nodes(comp), self.end_stub]
+            subgraph = components.get_matrix(comp)
+            subgraphs.append(SubGraph(self._all_nodes[idxs[:-1]], subgraph))
+            if idxs.size == 2:
+                paths.append([idxs[0]])
+                infos.append((0, 0))
+                continue
+            path = self._follow_path(best_starts[comp], next_nodes,
+                                     from_dist)
+            if path is None:
+                logging.warning("No max path to the end in component %s. "
+                                "Using its first node", comp)
+                paths.append([idxs[0]])
+                infos.append((0, 0))
+                continue
+            paths.append(path)
+            infos.append(
+                SubGraphAnalyzer(subgraph, np.searchsorted(idxs, path),
+                                 to_dist[idxs], from_dist[idxs]).get_info())
+        return paths, infos, subgraphs
 
-    def max_paths(self):
+    def max_paths_by_bellman_ford(self):
+        """Old version of max_paths, running Bellman-Ford from every node
+        of each component. Also works if the line graph has cycles"""
         start_nodes = np.r_[np.arange(self.n_starts),
                             self.n_starts+self.filtered._full_starts,
                             self.n_nodes-self.n_ends+self.filtered._end_starts]
@@ -329,8 +598,6 @@ class PosDividedLineGraph(DividedLinegraph):
         n_components, connected_components = csgraph.connected_components(
             self._matrix[:self.end_stub, :self.end_stub])
         logging.info("Found %s components", n_components)
-        # node_id_refs = []
-        # subgraphs = []
         for comp in range(n_components):
             if comp % 100 == 0:
                 logging.info("Component %s of %s", comp, n_components)
@@ -350,7 +617,10 @@ class PosDividedLineGraph(DividedLinegraph):
             local_idxs = self._backtrace(distances, predecessors, start_nodes)
             global_idxs = idxs[local_idxs]
             paths.append(global_idxs[::-1])
+            local_path = local_idxs[::-1]
             infos.append(
-                SubGraphAnalyzer(subgraph, local_idxs[::-1], distances).get_info())
+                SubGraphAnalyzer(subgraph, local_path,
+                                 distances[local_path[0]],
+                                 distances[:, -1]).get_info())
+        self._matrix.data -= 1
         return paths, infos, subgraphs
-
@@ -2,7 +2,7 @@ import logging
 import numpy as np
 
 from .segmentanalyzer import SegmentAnalyzer
-from .graphs import DividedLinegraph, DummyTouched
+from .graphs import DividedLinegraph, DummyTouched, get_touched_mask
 from ..sparsediffs import SparseValues
 
 
@@ -60,13 +60,12 @@ class HolesCleaner:
 
     def _filter_touched_nodes(self, node_values):
         if not self._touched_nodes:
+            self._not_touched = np.empty(0, dtype="int")
             return node_values
-        touched = [i for i, node in enumerate(node_values[0])
-                   if node+self._graph.min_node-1 in self._touched_nodes]
-        self._not_touched = np.array(
-            [i for i in node_values[0]
-             if i+self._graph.min_node-1 not in self._touched_nodes],
-            dtype="int")
+        node_idxs = node_values[0].astype("int")
+        touched = get_touched_mask(self._touched_nodes).contains_many(
+            node_idxs+self._graph.min_node-1)
+        self._not_touched = node_idxs[~touched]
         return node_values[:, touched]
 
     def run(self):
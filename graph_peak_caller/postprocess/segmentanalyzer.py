@@ -1,5 +1,4 @@
 import numpy as np
-from itertools import chain
 
 
 class SegmentAnalyzer:
@@ -12,10 +11,11 @@ class SegmentAnalyzer:
         self.ends = []
 
     def _get_spanning_nodes(self, start_ids, end_ids):
-        spanning = end_ids > start_ids+1
-        return list(chain.from_iterable(
-            range(start+1, end) for start, end in
-            zip(start_ids[spanning], end_ids[spanning])))
+        """All node ids strictly between each start and end id"""
+        n_spanned = np.maximum(end_ids-start_ids-1, 0).astype("int")
+        offsets = np.cumsum(n_spanned)-n_spanned
+        return np.arange(n_spanned.sum(), dtype="int") + \
+            np.repeat(start_ids+1-offsets, n_spanned).astype("int")
 
     def _is_starts(self, offsets, node_ids):
         return offsets == self.node_indexes[node_ids-1]
@@ -23,36 +23,39 @@ class SegmentAnalyzer:
     def _is_ends(self, offsets, node_ids):
         return offsets == self.node_indexes[node_ids]
 
-    def get_starts(self):
-        a = np.transpose(np.array(self.starts))
-        if not a.size:
+    @staticmethod
+    def _join(pairs):
+        if not pairs:
             return np.empty((2, 0), dtype="int")
+        return np.vstack((np.concatenate([p[0] for p in pairs]),
+                          np.concatenate([p[1] for p in pairs]))).astype("int")
+
+    def get_starts(self):
+        a = self._join(self.starts)
         a[1] = a[1]-self.node_indexes[a[0]-1]
-        return a.astype("int")
+        return a
 
     def get_ends(self):
-        a = np.transpose(np.array(self.ends, dtype="int"))
-        if not a.size:
-            return np.empty((2, 0), dtype="int")
+        a = self._join(self.ends)
         a[1] = self.node_indexes[a[0]]-a[1]
-        return a.astype("int")
+        return a
 
     def get_fulls(self):
-        a = np.array(self.fulls, dtype="int")
+        a = np.concatenate(self.fulls).astype("int") if self.fulls \
+            else np.empty(0, dtype="int")
         if not a.size:
             return np.empty((2, 0))
         sizes = self.node_indexes[a] - self.node_indexes[a-1]
         return np.vstack((a, sizes.astype("int"))).astype("int")
 
     def add_starts(self, node_ids, offsets):
-        self.starts.extend(zip(node_ids, offsets))
+        self.starts.append((node_ids, offsets))
 
     def add_ends(self, node_ids, offsets):
-
-        self.ends.extend(zip(node_ids, offsets))
+        self.ends.append((node_ids, offsets))
 
     def add_fulls(self, node_ids):
-        self.fulls.extend(node_ids)
+        self.fulls.append(np.asanyarray(node_ids))
 
     def handle_internal(self):
         is_starts = self._is_starts(self._internal_segments[:, 0],
@@ -120,7 +123,6 @@ class SegmentSplitter(SegmentAnalyzer):
         splitted_segments[n_old:n_old+n_new, 0] = self.node_indexes[
             self._spanning_ids[:, 1]-1]
         splitted_segments[n_old:n_old+n_new, 1] = self._spanning_segments[:, 1]
-        spanned = np.array(spanned, dtype="int")
         if n_spanned:
             splitted_segments[-n_spanned:, 0] = self.node_indexes[spanned-1]
             splitted_segments[-n_spanned:, 1] = self.node_indexes[spanned]
@@ -2,19 +2,22 @@ import numpy as np
 
 
 class SubGraphAnalyzer:
-    def __init__(self, subgraph, max_path, dists):
+    def __init__(self, subgraph, max_path, to_dists, from_dists):
+        """to_dists are the distances from the start of the max path
+        to each node, from_dists the distances from each node to the
+        end stub (the last node in subgraph)"""
         self._subgraph = subgraph
-        self._score = np.min(dists[:, -1])
-        self._max_path = max_path
-        self._dists = dists
+        self._score = np.min(from_dists)
+        self._max_path = np.asanyarray(max_path)
+        self._to_dists = to_dists
+        self._from_dists = from_dists
 
     def get_info(self):
         return (self.has_two_bindings(), self.is_ambiguous())
 
     def get_pruned_graph(self):
-        to_dists = self.dists[self._max_path, :]
-        from_dists = self.dists[:, -1]
-        return np.flatnonzero(to_dists+from_dists == self._score)
+        return np.flatnonzero(
+            self._to_dists+self._from_dists == self._score)
 
     def has_two_bindings(self):
         if len(self._max_path) <= 1:
@@ -23,17 +26,17 @@ class SubGraphAnalyzer:
         return np.sum(sizes) != self._score
 
     def is_ambiguous(self):
+        """Check if any edge leaving the max path starts another path
+        with the same score"""
         if len(self._max_path) <= 1:
             return False
-        for node in self._max_path[:-1]:
-            to_dist = self._dists[self._max_path[0], node]
-            row = self._subgraph[node]
-            for next_node, d in zip(row.indices, row.data):
-                if next_node in self._max_path:
-                    continue
-                s = to_dist + d + self._dists[next_node, -1]
-                assert s+0.0001 >= self._score, (self._score, s)
-                if s == self._score:
-                    return True
-
-        return False
+        on_path = np.zeros(self._subgraph.shape[0], dtype="bool")
+        on_path[self._max_path] = True
+        out_edges = self._subgraph[self._max_path[:-1]].tocoo()
+        from_nodes = self._max_path[:-1][out_edges.row]
+        off_path = ~on_path[out_edges.col]
+        scores = self._to_dists[from_nodes[off_path]] + \
+            out_edges.data[off_path] + \
+            self._from_dists[out_edges.col[off_path]]
+        assert np.all(scores+0.0001 >= self._score), (self._score, scores)
+        return bool(np.any(scores == self._score))
@@ -6,6 +6,8 @@ from graph_peak_caller.shiftestimation.shift_estimation_multigraph \
     import MultiGraphShiftEstimator
 from graph_peak_caller.util import create_linear_map
 from graph_peak_caller.multiplegraphscallpeaks import MultipleGraphsCallpeaks
+from graph_peak_caller.intervals import ColumnarIntervals
+from graph_peak_caller.callpeaks_interface import parse_input_file
 
 
 def count_unique_reads_interface(args):
@@ -80,6 +82,16 @@ def create_linear_map_interface(args):
     logging.info("Wrote linear map to file %s" % out_name)
 
 
+def alignments_to_arrays(args):
+    out_file_name = args.out_file_name
+    if not ColumnarIntervals.is_columnar_file(out_file_name):
+        out_file_name += ".intervalarrays"
+    logging.info("Converting %s to columnar intervals" % args.alignments_file_name)
+    intervals = parse_input_file(args.alignments_file_name, args.graph)
+    ColumnarIntervals.from_intervals(intervals).to_file(out_file_name)
+    logging.info("Wrote columnar intervals to %s" % out_file_name)
+
+
 def split_vg_json_reads_into_chromosomes(args):
     reads_base_name = '.'.join(args.vg_json_reads_file_name.split(".")[0:-1])
     logging.info("Will write reads to files %s_[chromosome].json",
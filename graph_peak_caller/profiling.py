@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import functools
+from contextlib import contextmanager
+
+
+def get_peak_rss():
+    """Peak resident set size of this process so far in MB. ru_maxrss
+    is in bytes on macOS and in kilobytes on Linux"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss / 1024**2
+    return max_rss / 1024
+
+
+def get_size(obj):
+    """Number of elements in a pileup or collection, or None"""
+    for attr in ("indices", "_indices"):
+        if hasattr(obj, attr):
+            return len(getattr(obj, attr))
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+class StageProfiler:
+    """Records wall time, cpu time, peak memory and array sizes for
+    the stages of a run, and writes them to a json file.
+
+    The peak memory of a process can only be read as the peak since the
+    process started. Each stage records that peak when it ends
+    (process_peak_rss_mb) and how much it rose during the stage
+    (peak_rss_increase_mb). The increase is 0 for a stage that stays
+    below the peak of an earlier stage.
+
+    Stages are stored by name, so that profiles from the different
+    steps of a run (i.e. before and after p-values) are merged into
+    the same file."""
+
+    def __init__(self, file_name, enabled=True):
+        self._file_name = file_name
+        self.enabled = enabled
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield {}
+            return
+        sizes = {}
+        start_wall = time.time()
+        start_cpu = time.process_time()
+        start_peak_rss = get_peak_rss()
+        yield sizes
+        peak_rss = get_peak_rss()
+        record = {"start": start_wall,
+                  "wall_time": time.time()-start_wall,
+                  "cpu_time": time.process_time()-start_cpu,
+                  "process_peak_rss_mb": peak_rss,
+                  "peak_rss_increase_mb": peak_rss-start_peak_rss,
+                  "pid": os.getpid(),
+                  "sizes": sizes}
+        logging.info(
+            "Stage %s: %.2fs wall, %.2fs cpu, %.1f MB process peak "
+            "(+%.1f MB)" % (name, record["wall_time"], record["cpu_time"],
+                            peak_rss, record["peak_rss_increase_mb"]))
+        self._write_stage(name, record)
+
+    def _write_stage(self, name, record):
+        stages = {}
+        if os.path.isfile(self._file_name):
+            with open(self._file_name) as f:
+                stages = json.load(f)
+        stages[name] = record
+        with open(self._file_name, "w") as f:
+            json.dump(stages, f, indent=1)
+
+
+def profiled(name, **size_attributes):
+    """Decorator for methods of classes holding a reporter. Profiles
+    the method as stage name, and records the sizes of the given
+    attributes of the object after the stage has run, e.g.
+    @profiled("p_values", n_p_values="p_values_pileup")"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self._reporter.stage(name) as sizes:
+                result = func(self, *args, **kwargs)
+                for key, attr in size_attributes.items():
+                    sizes[key] = get_size(getattr(self, attr, None))
+            return result
+        return wrapper
+    return decorator
@@ -2,11 +2,15 @@ import logging
 import numpy as np
 
 from .peakcollection import PeakCollection
+from .profiling import StageProfiler
 
 
 class Reporter:
-    def __init__(self, base_name):
+    def __init__(self, base_name, profile=False, text_all_max_paths=False):
         self._base_name = base_name
+        self._profile = profile
+        self._text_all_max_paths = text_all_max_paths
+        self._profiler = StageProfiler(base_name + "profile.json", profile)
 
     def sub_graphs(self, data):
         np.savez(self._base_name + "sub_graphs.graphs",
@@ -23,14 +27,20 @@ class Reporter:
             self._base_name + "pvalues")
 
     def all_max_paths(self, data):
-        PeakCollection(data).to_file(
-            self._base_name+"all_max_paths.intervalcollection",
-            text_file=True)
+        peaks = PeakCollection(data)
+        peaks.to_peaks_file(self._base_name+"all_max_paths.peaks.npz")
+        if self._text_all_max_paths:
+            peaks.to_file(self._base_name+"all_max_paths.intervalcollection",
+                          text_file=True)
 
     def max_paths(self, data):
-        PeakCollection(data).to_file(
-            self._base_name+"max_paths.intervalcollection",
-            text_file=True)
+        peaks = PeakCollection(data)
+        peaks.to_peaks_file(self._base_name+"max_paths.peaks.npz")
+        peaks.to_file(self._base_name+"max_paths.intervalcollection",
+                      text_file=True)
+
+    def pvalues_histogram(self, data):
+        data.to_file(self._base_name + "pvalues_histogram.npz")
 
     def hole_cleaned(self, data):
         data.to_sparse_files(self._base_name+"hole_cleaned")
@@ -48,8 +58,7 @@ class Reporter:
         data.to_sparse_files(self._base_name+"direct_pileup")
 
     def touched_nodes(self, data):
-        np.save(self._base_name + "touched_nodes.npy",
-                np.array(list(data), dtype="int"))
+        data.to_file(self._base_name + "touched_nodes.npy")
 
     def add(self, name, data):
         if hasattr(self, name):
@@ -58,8 +67,12 @@ class Reporter:
         else:
             logging.info("Skipping reporting of %s", name)
 
+    def stage(self, name):
+        return self._profiler.stage(name)
+
     def get_sub_reporter(self, name):
         if name != "":
             name += "_"
 
-        return self.__class__(self._base_name + name)
+        return self.__class__(self._base_name + name, self._profile,
+                              self._text_all_max_paths)
@@ -3,7 +3,9 @@ import logging
 from itertools import chain
 from collections import defaultdict
 from ..sparsediffs import SparseDiffs
+from ..intervals import ColumnarIntervals, UniqueIntervals
 from ..custom_exceptions import InvalidPileupInterval
+from ..touchednodes import TouchedNodes
 
 
 class NodeInfo:
@@ -99,6 +101,48 @@ class ReadsAdder:
             self._handle_interval(interval)
             i += 1
 
+    def _get_array_rps(self, node_ids):
+        rps = np.abs(node_ids)-self.min_id
+        if rps.size and (rps.min() < 0 or rps.max() >= self._node_indexes.size-1):
+            raise InvalidPileupInterval(
+                "Reads have node(s) not part of graph/pileup: %s" % node_ids[
+                    (rps < 0) | (rps >= self._node_indexes.size-1)][:10])
+        return rps
+
+    def _add_array_ends(self, reads):
+        end_nodes = reads.end_nodes
+        args = np.argsort(end_nodes, kind="mergesort")
+        node_ids, first_idxs = np.unique(end_nodes[args], return_index=True)
+        offsets_list = np.split(reads.end_offsets[args], first_idxs[1:])
+        for node_id, offsets in zip(node_ids, offsets_list):
+            ends = self._neg_ends if node_id < 0 else self._pos_ends
+            ends[int(node_id)].extend(offsets.tolist())
+
+    def add_read_arrays(self, reads):
+        """Add all reads in a ColumnarIntervals in one go"""
+        logging.info("Adding %d reads from arrays" % reads.n_reads)
+        rps = self._get_array_rps(reads.region_paths)
+        self._pileup.touched_nodes[rps] = True
+        is_reverse = reads.is_reverse
+        rev = np.repeat(is_reverse, reads.n_region_paths).astype("int")
+        is_first = np.zeros(rps.size, dtype="bool")
+        is_first[reads.region_path_offsets[:-1]] = True
+        is_last = np.zeros(rps.size, dtype="bool")
+        is_last[reads.region_path_offsets[1:]-1] = True
+        idxs = np.r_[(rps+rev)[~is_first], (rps+1-rev)[~is_last]]
+        weights = np.r_[(1-2*rev)[~is_first], (2*rev-1)[~is_last]]
+        self._pileup.node_starts += np.bincount(
+            idxs, weights, minlength=self._pileup.node_starts.size)
+
+        start_rps = self._get_array_rps(reads.start_nodes)
+        self._pileup.starts.extend(
+            (self._node_indexes[start_rps[~is_reverse]] +
+             reads.start_offsets[~is_reverse]).tolist())
+        self._pileup.ends.extend(
+            (self._node_indexes[start_rps[is_reverse]+1] -
+             reads.start_offsets[is_reverse]).tolist())
+        self._add_array_ends(reads)
+
 
 class ReadsAdderWDirect(ReadsAdder):
     def __init__(self, graph, pileup):
@@ -118,6 +162,17 @@ class ReadsAdderWDirect(ReadsAdder):
             self.pos_read_ends.append(
                 self._node_indexes[abs(rp)-self.min_id]+end_pos.offset)
 
+    def add_read_arrays(self, reads):
+        super().add_read_arrays(reads)
+        end_rps = self._get_array_rps(reads.end_nodes)
+        is_reverse = reads.is_reverse
+        self.neg_read_ends.extend(
+            (self._node_indexes[end_rps[is_reverse]+1] -
+             reads.end_offsets[is_reverse]).tolist())
+        self.pos_read_ends.extend(
+            (self._node_indexes[end_rps[~is_reverse]] +
+             reads.end_offsets[~is_reverse]).tolist())
+
 
 class SparseExtender:
     def __init__(self, graph, pileup, fragment_length):
@@ -145,6 +200,9 @@ class SparseExtender:
     def _add_end(self, index):
         self._pileup.ends.append(index)
 
+    def _add_ends(self, indexes):
+        self._pileup.ends.extend(indexes.tolist())
+
     def _get_array_idx(self, node_id):
         return self._graph.node_indexes[node_id-self._graph.min_node]
 
@@ -210,17 +268,85 @@ class ReverseSparseExtender(SparseExtender):
     def _add_end(self, index):
         self._pileup.starts.append(self._graph_size-index)
 
+    def _add_ends(self, indexes):
+        self._pileup.starts.extend((self._graph_size-indexes).tolist())
+
+
+class ArraySparseExtender(SparseExtender):
+    """Extends reads like SparseExtender, but keeps the reads passing
+    into each node as arrays of read ids and remaining lengths instead
+    of NodeInfo dicts. Frontiers coming from several predecessors are
+    merged by taking the max remaining length for each read id.
+    """
+
+    @staticmethod
+    def _merge_frontiers(frontiers):
+        if len(frontiers) == 1:
+            return frontiers[0]
+        read_ids = np.concatenate([frontier[0] for frontier in frontiers])
+        remaining = np.concatenate([frontier[1] for frontier in frontiers])
+        args = np.lexsort((remaining, read_ids))
+        read_ids = read_ids[args]
+        remaining = remaining[args]
+        is_last = np.r_[read_ids[1:] != read_ids[:-1], True]
+        return read_ids[is_last], remaining[is_last]
+
+    def run_linear(self, starts_dict):
+        node_ids = self.get_node_ids()
+        node_sizes = np.diff(self._graph.node_indexes)
+        min_node = self._graph.min_node
+        frontiers = defaultdict(list)
+        cur_id = 0
+        n_nodes = len(node_ids)
+        for counter, node_id in enumerate(node_ids):
+            if counter % 1000000 == 0:
+                logging.info("Handling node %s of %s", counter, n_nodes)
+            starts = starts_dict[node_id]
+            incoming = frontiers.pop(node_id, None)
+            if not starts and incoming is None:
+                continue
+            read_ids = np.arange(cur_id, cur_id+len(starts))
+            remaining = np.asarray(starts, dtype="int64") + \
+                self._fragment_length
+            cur_id += len(starts)
+            if incoming is not None:
+                in_ids, in_remaining = self._merge_frontiers(incoming)
+                self._pileup.touched_nodes[abs(node_id)-min_node] = True
+                self._add_node_start(node_id, in_ids.size)
+                read_ids = np.concatenate((read_ids, in_ids))
+                remaining = np.concatenate((remaining, in_remaining))
+            node_size = node_sizes[abs(node_id)-min_node]
+            is_ending = remaining <= node_size
+            self._add_ends(self._get_array_idx(node_id)+remaining[is_ending])
+            passing = ~is_ending
+            if not np.any(passing):
+                continue
+            frontier = (read_ids[passing], remaining[passing]-node_size)
+            self._add_node_end(node_id, frontier[0].size)
+            for next_node in self._adj_list[node_id]:
+                frontiers[next_node].append(frontier)
+
+
+class ArrayReverseSparseExtender(ArraySparseExtender, ReverseSparseExtender):
+    pass
+
 
 class SamplePileupGenerator:
-    def __init__(self, graph, extension):
+    def __init__(self, graph, extension, use_array_extender=True):
         logging.info("Using extension %d when extending reads. " % extension)
         if extension < 0:
             raise Exception("Invalid extension size %d used. Must be positive. Is fragment length < read length?" % extension)
         self._pileup = SparseGraphPileup(graph)
         self._graph = graph
         self._reads_adder = ReadsAdderWDirect(graph, self._pileup)
-        self._pos_extender = SparseExtender(graph, self._pileup, extension)
-        self._neg_extender = ReverseSparseExtender(
+        if use_array_extender:
+            extender_class = ArraySparseExtender
+            reverse_extender_class = ArrayReverseSparseExtender
+        else:
+            extender_class = SparseExtender
+            reverse_extender_class = ReverseSparseExtender
+        self._pos_extender = extender_class(graph, self._pileup, extension)
+        self._neg_extender = reverse_extender_class(
             graph, self._pileup, extension)
 
     def get_direct_pileup(self):
@@ -237,14 +363,18 @@ class SamplePileupGenerator:
         return sparse_values
 
     def run(self, reads, reporter=None):
-        self._reads_adder.add_reads(reads)
+        if isinstance(reads, UniqueIntervals):
+            reads = reads.get_unique()
+        if isinstance(reads, ColumnarIntervals):
+            self._reads_adder.add_read_arrays(reads)
+        else:
+            self._reads_adder.add_reads(reads)
         if reporter is not None:
             reporter.add("direct_pileup", self.get_direct_pileup())
         self._pos_extender.run_linear(self._reads_adder.get_pos_ends())
         self._neg_extender.run_linear(self._reads_adder.get_neg_ends())
         sdiffs = SparseDiffs.from_pileup(self._pileup,
                                          self._graph.node_indexes)
-        sdiffs.touched_nodes = set(
-            np.flatnonzero(
-                self._pileup.touched_nodes[:-2]) + self._graph.min_node)
+        sdiffs.touched_nodes = TouchedNodes.from_mask(
+            self._pileup.touched_nodes[:-2], self._graph.min_node)
         return sdiffs
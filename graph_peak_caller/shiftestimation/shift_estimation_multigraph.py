@@ -30,7 +30,7 @@ class MultiGraphShiftEstimator(object):
         i = 0
         for graph, intervals in zip(graph_file_names,
                                     interval_json_file_names):
-            linear_filter = LinearFilter.from_vg_json_reads_and_graph(
+            linear_filter = LinearFilter.from_reads_file_and_graph(
                 intervals, graph)
 
             positions = linear_filter.find_start_positions()
@@ -75,6 +75,72 @@ class SparseValues:
             pileup = pileup.astype("bool")
         return pileup
 
+    def get_interval_scores(self, starts, ends, interval_ids):
+        """Max, mean and summit of the track in each of a batch of
+        intervals, without creating the dense track.
+
+        Each interval is given as one or more linear ranges
+        [starts, ends), in the order they are traversed. interval_ids
+        gives the interval of each range and must be 0, 1, ... n-1,
+        sorted and with at least one non-empty range per interval.
+        The summit is the median position (offset into the interval)
+        among the positions having the maximum value"""
+        starts = np.asanyarray(starts)
+        ends = np.asanyarray(ends)
+        interval_ids = np.asanyarray(interval_ids)
+        if not interval_ids.size:
+            return np.zeros(0), np.zeros(0), np.zeros(0, dtype="int")
+        n_intervals = interval_ids[-1]+1
+
+        # Segment k of the track is [indices[k-1], indices[k]), with
+        # value 0 before the first index
+        values = np.r_[0, self.values]
+        segment_starts = np.r_[np.iinfo(np.int64).min, self.indices]
+        segment_ends = np.r_[self.indices, np.iinfo(np.int64).max]
+        first = np.searchsorted(self.indices, starts, side="right")
+        last = np.searchsorted(self.indices, ends, side="left")
+        n_segments = np.maximum(last-first+1, 0)
+        range_idxs = np.repeat(np.arange(starts.size), n_segments)
+        segments = np.arange(range_idxs.size) - \
+            np.repeat(np.cumsum(n_segments)-n_segments, n_segments) + \
+            np.repeat(first, n_segments)
+        seg_starts = np.maximum(segment_starts[segments], starts[range_idxs])
+        seg_ends = np.minimum(segment_ends[segments], ends[range_idxs])
+        nonempty = seg_ends > seg_starts
+        range_idxs = range_idxs[nonempty]
+        seg_starts = seg_starts[nonempty]
+        lengths = seg_ends[nonempty]-seg_starts
+        seg_values = values[segments[nonempty]]
+        seg_ids = interval_ids[range_idxs]
+
+        # Offset of each range into its interval
+        range_lengths = np.maximum(ends-starts, 0)
+        range_offsets = np.cumsum(range_lengths)-range_lengths
+        interval_starts = np.searchsorted(interval_ids, np.arange(n_intervals))
+        range_offsets -= range_offsets[interval_starts][interval_ids]
+        seg_offsets = range_offsets[range_idxs] + \
+            seg_starts - starts[range_idxs]
+
+        group_starts = np.searchsorted(seg_ids, np.arange(n_intervals))
+        assert np.all(np.diff(np.r_[group_starts, seg_ids.size]) > 0), \
+            "Empty interval in %s" % interval_ids
+        max_values = np.maximum.reduceat(seg_values, group_starts)
+        mean_values = np.add.reduceat(seg_values*lengths, group_starts) / \
+            np.add.reduceat(lengths, group_starts)
+
+        is_max = seg_values == max_values[seg_ids]
+        max_lengths = lengths[is_max]
+        max_offsets = seg_offsets[is_max]
+        cum_lengths = np.cumsum(max_lengths)
+        max_group_starts = np.searchsorted(seg_ids[is_max],
+                                           np.arange(n_intervals))
+        n_before = np.r_[0, cum_lengths][max_group_starts]
+        ranks = n_before + np.add.reduceat(max_lengths, max_group_starts)//2
+        idxs = np.searchsorted(cum_lengths, ranks, side="right")
+        summits = max_offsets[idxs] + ranks - \
+            (cum_lengths[idxs]-max_lengths[idxs])
+        return max_values, mean_values, summits
+
     @classmethod
     def from_dense_pileup(cls, pileup):
         changes = pileup[1:] != pileup[:-1]
@@ -140,23 +206,34 @@ class SparseDiffs:
         values = np.cumsum(diffs)
         return SparseValues(self._indices[args], values, sanitize=True)
 
+    def _get_values_at(self, indices):
+        """Value of the track at each of the sorted indices"""
+        sorted_indices = self._indices
+        diffs = self._diffs
+        if np.any(sorted_indices[1:] < sorted_indices[:-1]):
+            args = np.argsort(sorted_indices, kind="mergesort")
+            sorted_indices = sorted_indices[args]
+            diffs = diffs[args]
+        values = np.cumsum(diffs, dtype="float")
+        idxs = np.searchsorted(sorted_indices, indices, side="right")
+        # idxs is 0 before the first index, where the value is 0
+        return np.r_[0, values][idxs]
+
     def maximum(self, other):
-        all_indices = np.r_[self._indices, other._indices]
-        sorted_args = np.argsort(all_indices, kind="mergesort")
-        new_indexes = all_indices[sorted_args]
-        unique_mask = np.ediff1d(new_indexes, to_end=1) != 0
-        new_indexes = new_indexes[unique_mask]
-        diffs = np.zeros((2, all_indices.size))
-        my_args = sorted_args < self._indices.size
-        other_args = ~my_args
-        diffs[0][my_args] = self._diffs
-        diffs[1][other_args] = other._diffs
-        values = np.cumsum(diffs, axis=1)
-        max_values = np.max(values, axis=0)
-        max_values = max_values[unique_mask]
+        return self.maximum_of([self, other])
+
+    @classmethod
+    def maximum_of(cls, sparse_diffs_list):
+        """Elementwise maximum of all the tracks in one merge"""
+        new_indexes = np.unique(
+            np.concatenate([sd._indices for sd in sparse_diffs_list]))
+        max_values = sparse_diffs_list[0]._get_values_at(new_indexes)
+        for sparse_diffs in sparse_diffs_list[1:]:
+            np.maximum(max_values, sparse_diffs._get_values_at(new_indexes),
+                       out=max_values)
         new_diffs = np.ediff1d(
             max_values, to_begin=max_values[0])
-        return SparseDiffs(new_indexes, new_diffs, True)
+        return cls(new_indexes, new_diffs, True)
 
     def _sanitize(self):
         # Remove duplicated values
@@ -206,18 +283,9 @@ class SparseDiffs:
         return self
 
     def apply_binary_func(self, func, other, return_values=False):
-        all_indices = np.r_[self._indices, other._indices]
-        sorted_args = np.argsort(all_indices, kind="mergesort")
-        new_indexes = all_indices[sorted_args]
-        unique_mask = np.ediff1d(new_indexes, to_end=1) != 0
-        new_indexes = new_indexes[unique_mask]
-        diffs = np.zeros((2, all_indices.size))
-        my_args = sorted_args < self._indices.size
-        other_args = ~my_args
-        diffs[0][my_args] = self._diffs
-        diffs[1][other_args] = other._diffs
-        values = np.cumsum(diffs, axis=1)
-        ret = func(values[0], values[1])[unique_mask]
+        new_indexes = np.union1d(self._indices, other._indices)
+        ret = func(self._get_values_at(new_indexes),
+                   other._get_values_at(new_indexes))
         if return_values:
             return SparseValues(new_indexes, ret, sanitize=True)
         return SparseDiffs(
@@ -1,29 +1,97 @@
 from glob import glob
-import pickle
 import numpy as np
 import os
 from scipy.stats import poisson
 import scipy
 import logging
+from collections import OrderedDict
 from .sparsediffs import SparseValues
 
 
+def get_poisson_p_values(counts, lambdas):
+    """-log10 of the poisson survival function. 0 where count is 0"""
+    with scipy.errstate(divide='ignore'):
+        p_values = poisson.logsf(counts, lambdas)
+
+    p_values /= -np.log(10)
+    p_values[counts == 0] = 0
+    p_values[np.isinf(p_values)] = 1000
+    return p_values
+
+
+class PoissonPValuesCache:
+    """Bounded LRU cache of p-values keyed on (count, lambda).
+
+    If lambda_decimals is set, lambdas are rounded to that many
+    decimals before lookup, so that nearly equal lambdas share entries.
+    """
+    def __init__(self, max_size, lambda_decimals=None):
+        self._max_size = max_size
+        self._lambda_decimals = lambda_decimals
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get_p_values(self, counts, lambdas):
+        if self._lambda_decimals is not None:
+            lambdas = np.round(lambdas, self._lambda_decimals)
+        keys = list(zip(counts.tolist(), lambdas.tolist()))
+        p_values = np.empty(len(keys))
+        missing = []
+        for i, key in enumerate(keys):
+            p_value = self._cache.get(key)
+            if p_value is None:
+                missing.append(i)
+                continue
+            self._cache.move_to_end(key)
+            p_values[i] = p_value
+        missing = np.array(missing, dtype="int")
+        p_values[missing] = get_poisson_p_values(
+            counts[missing], lambdas[missing])
+        for i in missing.tolist():
+            self._cache[keys[i]] = p_values[i]
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+        logging.info("Computed %d of %d p-values, %d found in cache" % (
+            missing.size, len(keys), len(keys)-missing.size))
+        return p_values
+
+
+_p_values_caches = {}
+
+
+def get_p_values_cache(max_size, lambda_decimals=None):
+    """Cache shared by all runs in this process, None if max_size is 0"""
+    if not max_size:
+        return None
+    key = (max_size, lambda_decimals)
+    if key not in _p_values_caches:
+        _p_values_caches[key] = PoissonPValuesCache(max_size, lambda_decimals)
+    return _p_values_caches[key]
+
+
 class PValuesFinder:
-    def __init__(self, sample_pileup, control_pileup):
+    def __init__(self, sample_pileup, control_pileup, cache=None):
         self.sample = sample_pileup
         self.control = control_pileup
+        self._cache = cache
+
+    def _get_unique_p_values(self, counts, lambdas):
+        if self._cache is None:
+            return get_poisson_p_values(counts, lambdas)
+        return self._cache.get_p_values(counts, lambdas)
 
     def get_p_values_pileup(self):
-        baseEtoTen = np.log(10)
 
         def clean_p_values(counts, lambdas):
-            with scipy.errstate(divide='ignore'):
-                p_values = poisson.logsf(counts, lambdas)
-
-                p_values /= -baseEtoTen
-                p_values[counts == 0] = 0
-                p_values[np.isinf(p_values)] = 1000
-                return p_values
+            # The same (count, lambda) pairs occur many times, so
+            # p-values are only computed once for each distinct pair
+            pairs, inverse = np.unique(
+                np.column_stack((counts, lambdas)),
+                axis=0, return_inverse=True)
+            p_values = self._get_unique_p_values(pairs[:, 0], pairs[:, 1])
+            return p_values[inverse.ravel()]
 
         p_values = self.sample.apply_binary_func(
             clean_p_values, self.control,
@@ -31,6 +99,52 @@ class PValuesFinder:
         return p_values
 
 
+class PValuesHistogram:
+    """Number of base pairs having each distinct p-value.
+
+    Histograms from different graphs can be added together, so that
+    the p to q-value mapping for a whole genome can be made without
+    keeping all the p-values in memory at once.
+    """
+    def __init__(self, p_values, counts):
+        self.p_values = np.asanyarray(p_values)
+        self.counts = np.asanyarray(counts)
+
+    def __str__(self):
+        return str(self.p_values) + ":" + str(self.counts)
+
+    def __eq__(self, other):
+        return np.all(self.p_values == other.p_values) and \
+            np.all(self.counts == other.counts)
+
+    @classmethod
+    def _from_subcounts(cls, p_values, sub_counts):
+        p_values, inverse = np.unique(p_values, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=sub_counts,
+                             minlength=p_values.size)
+        return cls(p_values, counts.astype("int64"))
+
+    @classmethod
+    def from_p_values_pileup(cls, p_values):
+        sub_counts = np.ediff1d(
+            p_values.indices,
+            to_end=p_values.track_size-p_values.indices[-1])
+        return cls._from_subcounts(p_values.values, sub_counts)
+
+    def __add__(self, other):
+        return self._from_subcounts(
+            np.concatenate((self.p_values, other.p_values)),
+            np.concatenate((self.counts, other.counts)))
+
+    def to_file(self, file_name):
+        np.savez(file_name, p_values=self.p_values, counts=self.counts)
+
+    @classmethod
+    def from_file(cls, file_name):
+        data = np.load(file_name)
+        return cls(data["p_values"], data["counts"])
+
+
 class PToQValuesMapper:
 
     def __init__(self, p_values, cum_counts):
@@ -41,75 +155,126 @@ class PToQValuesMapper:
         return str(self.p_values) + ":" + str(self.cum_counts)
 
     @classmethod
-    def __read_file(cls, file_name):
-        indices = np.load(file_name + "_indexes.npy")
-        values = np.load(file_name + "_values.npy")
-        return indices, values
-
-    @classmethod
-    def _from_subcounts(cls, p_values, counts):
-        p_values = p_values.ravel()
-        counts = counts.ravel()
-        args = np.argsort(p_values)[::-1]
-        sorted_ps = p_values[args]
-        sorted_lens = counts[args]
-        cum_counts = np.cumsum(sorted_lens)
-        changes = np.ediff1d(sorted_ps, to_end=1) != 0
-        cum_counts = cum_counts[changes]
-        return cls(sorted_ps[changes], cum_counts)
+    def from_histogram(cls, histogram):
+        return cls(histogram.p_values[::-1],
+                   np.cumsum(histogram.counts[::-1]))
 
     @classmethod
     def from_p_values_pileup(cls, p_values):
         logging.info("Creating mapping from p value dense pileup")
-        sub_counts = cls.__get_sub_counts(p_values)
-        # sub_counts = np.ediff1d(
-        #     p_values.indices,
-        #     to_end=p_values.track_size-p_values.indices[-1])
-        return cls._from_subcounts(p_values.values, sub_counts)
-
-    @classmethod
-    def __get_sub_counts(cls, sparse_values):
-        return np.ediff1d(
-            sparse_values.indices,
-            to_end=sparse_values.track_size-sparse_values.indices[-1])
+        return cls.from_histogram(
+            PValuesHistogram.from_p_values_pileup(p_values))
 
     @classmethod
     def from_files(cls, base_file_name):
         search = base_file_name
         logging.info("Searching for files starting with %s" % search)
         files = glob(base_file_name + "*pvalues_indexes.npy")
-        sub_counts = []
-        p_values = []
+        histogram = None
         for filename in files:
             base_file_name = filename.replace("_indexes.npy", "")
-            logging.info("Reading p values from file %s" % base_file_name)
-            chr_p_values = SparseValues.from_sparse_files(base_file_name)
-            sub_counts.append(cls.__get_sub_counts(chr_p_values))
-            p_values.append(chr_p_values.values)
-            assert sub_counts[-1].size == p_values[-1].size
+            histogram_file_name = base_file_name + "_histogram.npz"
+            if os.path.isfile(histogram_file_name):
+                logging.info("Reading p value histogram from file %s" %
+                             histogram_file_name)
+                chr_histogram = PValuesHistogram.from_file(
+                    histogram_file_name)
+            else:
+                logging.info("Reading p values from file %s" % base_file_name)
+                chr_histogram = PValuesHistogram.from_p_values_pileup(
+                    SparseValues.from_sparse_files(base_file_name))
+            if histogram is None:
+                histogram = chr_histogram
+            else:
+                histogram = histogram + chr_histogram
 
-        return cls._from_subcounts(
-            np.concatenate(p_values),
-            np.concatenate(sub_counts))
+        logging.info("Found %d distinct p values" % histogram.p_values.size)
+        return cls.from_histogram(histogram)
 
-    def get_p_to_q_values(self):
+    def get_p_to_q_table(self):
         logN = np.log10(self.cum_counts[-1])
         q_values = self.p_values + np.log10(
             1+np.r_[0, self.cum_counts[:-1]])-logN
         q_values[0] = max(0, q_values[0])
         q_values = np.minimum.accumulate(q_values)
-        d = dict(zip(self.p_values, q_values))
-        d[0] = 0
-        return d
+        p_values = self.p_values[::-1]
+        q_values = q_values[::-1]
+        if p_values.size and p_values[0] == 0:
+            q_values[0] = 0
+        else:
+            p_values = np.r_[0, p_values]
+            q_values = np.r_[0, q_values]
+        return PToQTable(p_values, q_values)
+
+    def get_p_to_q_values(self):
+        return self.get_p_to_q_table().to_dict()
+
+    def to_file(self, base_name):
+        self.get_p_to_q_table().to_file(base_name)
+
+    @staticmethod
+    def has_up_to_date_table(base_name):
+        """Check that a table has been written after all p-value files"""
+        table_file_name = base_name + PToQTable.file_ending
+        if not os.path.isfile(table_file_name):
+            return False
+        p_value_files = glob(base_name + "*pvalues_indexes.npy")
+        return all(os.path.getmtime(table_file_name) >= os.path.getmtime(f)
+                   for f in p_value_files)
+
+
+class PToQTable:
+    """Mapping from p-values to q-values as two arrays sorted on p-value"""
+    file_ending = "p2q.npz"
+
+    def __init__(self, p_values, q_values):
+        self.p_values = np.asanyarray(p_values)
+        self.q_values = np.asanyarray(q_values)
+
+    def __str__(self):
+        return str(self.p_values) + ":" + str(self.q_values)
+
+    def __eq__(self, other):
+        return np.all(self.p_values == other.p_values) and \
+            np.allclose(self.q_values, other.q_values)
+
+    def get_q_values(self, p_values):
+        """Look up q-values for p_values. Unknown p-values give nan"""
+        idxs = np.searchsorted(self.p_values, p_values)
+        idxs = np.minimum(idxs, self.p_values.size-1)
+        is_found = self.p_values[idxs] == p_values
+        return np.where(is_found, self.q_values[idxs], np.nan)
+
+    def to_dict(self):
+        return dict(zip(self.p_values, self.q_values))
+
+    @classmethod
+    def from_dict(cls, p_to_q_values):
+        p_values = np.array(sorted(p_to_q_values.keys()), dtype="float")
+        q_values = np.array([p_to_q_values[p] for p in p_values],
+                            dtype="float")
+        return cls(p_values, q_values)
 
     def to_file(self, base_name):
-        with open(base_name + 'p2q.pkl', 'wb') as f:
-            pickle.dump(self._p_to_q_values, f, pickle.HIGHEST_PROTOCOL)
+        # Written to a temporary file first, so that other processes
+        # never read a half written table
+        file_name = base_name + self.file_ending
+        tmp_file_name = file_name + ".tmp%d" % os.getpid()
+        with open(tmp_file_name, "wb") as f:
+            np.savez(f, p_values=self.p_values, q_values=self.q_values)
+        os.replace(tmp_file_name, file_name)
+        logging.info("Wrote p to q-value table to %s" % file_name)
+
+    @classmethod
+    def from_file(cls, base_name):
+        data = np.load(base_name + cls.file_ending)
+        return cls(data["p_values"], data["q_values"])
 
 
 class QValuesFinder:
     def __init__(self, p_values_pileup, p_to_q_values):
-        assert isinstance(p_to_q_values, dict)
+        if isinstance(p_to_q_values, dict):
+            p_to_q_values = PToQTable.from_dict(p_to_q_values)
         self.p_values = p_values_pileup
         self.p_to_q_values = p_to_q_values
 
@@ -121,5 +286,4 @@ class QValuesFinder:
 
     def get_q_array_from_p_array(self, p_values):
         assert isinstance(p_values, np.ndarray)
-        trans = np.vectorize(self.p_to_q_values.get, otypes=[float])
-        return trans(p_values)
+        return self.p_to_q_values.get_q_values(p_values)
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class TouchedNodes:
+    """Set of node ids that are touched by reads, stored as packed
+    bits over the node ids starting at min_node. Supports the set
+    operations used by the pipeline (in, len, iteration) and vectorized
+    membership through contains_many."""
+
+    def __init__(self, bits, min_node):
+        self._bits = np.asanyarray(bits, dtype="uint8")
+        self.min_node = int(min_node)
+        self._n_touched = None
+
+    @classmethod
+    def from_mask(cls, mask, min_node):
+        """mask[i] tells whether node min_node+i is touched"""
+        return cls(np.packbits(np.asanyarray(mask, dtype="bool")), min_node)
+
+    @classmethod
+    def from_node_ids(cls, node_ids, min_node=None):
+        node_ids = np.asanyarray(node_ids, dtype="int")
+        if min_node is None:
+            min_node = node_ids.min() if node_ids.size else 0
+        node_ids = node_ids[node_ids >= min_node]
+        mask = np.zeros(node_ids.max()-min_node+1 if node_ids.size else 0,
+                        dtype="bool")
+        mask[node_ids-min_node] = True
+        return cls.from_mask(mask, min_node)
+
+    def to_mask(self):
+        return np.unpackbits(self._bits).astype("bool")
+
+    def contains_many(self, node_ids):
+        idxs = np.asanyarray(node_ids, dtype="int") - self.min_node
+        is_valid = (idxs >= 0) & (idxs < self._bits.size*8)
+        result = np.zeros(idxs.shape, dtype="bool")
+        idxs = idxs[is_valid]
+        result[is_valid] = (self._bits[idxs >> 3] >> (7-(idxs & 7))) & 1
+        return result
+
+    def __contains__(self, node_id):
+        return bool(self.contains_many(np.array([node_id]))[0])
+
+    def __len__(self):
+        if self._n_touched is None:
+            self._n_touched = int(np.unpackbits(self._bits).sum())
+        return self._n_touched
+
+    def __iter__(self):
+        return iter(self.node_ids())
+
+    def node_ids(self):
+        return np.flatnonzero(np.unpackbits(self._bits)) + self.min_node
+
+    def __eq__(self, other):
+        return np.array_equal(self.node_ids(), other.node_ids())
+
+    def __repr__(self):
+        return "TouchedNodes(%s)" % self.node_ids()
+
+    def to_file(self, file_name):
+        np.save(file_name, self._bits)
+
+    @classmethod
+    def from_file(cls, file_name, min_node):
+        """Read packed bits written by to_file. Files holding an array
+        of node ids (as written by older versions) are also accepted"""
+        data = np.load(file_name)
+        if data.dtype == np.uint8:
+            return cls(data, min_node)
+        return cls.from_node_ids(data, min_node)
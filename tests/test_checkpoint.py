@@ -0,0 +1,46 @@
+import os
+import unittest
+import numpy as np
+from graph_peak_caller import Configuration
+from graph_peak_caller.checkpoint import get_fingerprint
+from graph_peak_caller.intervals import ColumnarIntervals
+
+
+class TestGetFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.config = Configuration()
+        self.config.fragment_length = 5
+        self.config.read_length = 2
+
+    def _write_reads(self, end_offsets):
+        ColumnarIntervals([1, 2], [0, 1, 2], [0, 0],
+                          end_offsets).to_file("test_checkpoint.intervalarrays")
+
+    def test_changed_directory(self):
+        self._write_reads([3, 4])
+        fingerprint = get_fingerprint(["test_checkpoint.intervalarrays"],
+                                      self.config)
+        self.assertIsNotNone(fingerprint)
+        self._write_reads([3, 4, 5, 6])
+        self.assertNotEqual(
+            get_fingerprint(["test_checkpoint.intervalarrays"], self.config),
+            fingerprint)
+
+    def test_missing_file(self):
+        if os.path.exists("test_checkpoint_missing.npy"):
+            os.remove("test_checkpoint_missing.npy")
+        self.assertIsNone(
+            get_fingerprint(["test_checkpoint_missing.npy"], self.config))
+
+    def test_config_fields(self):
+        inputs = [np.arange(3), None]
+        fingerprint = get_fingerprint(inputs, self.config)
+        self.config.background_cache_dir = "background_cache"
+        self.config.p_values_cache_size = 1000
+        self.assertEqual(get_fingerprint(inputs, self.config), fingerprint)
+        self.config.fragment_length = 6
+        self.assertNotEqual(get_fingerprint(inputs, self.config), fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
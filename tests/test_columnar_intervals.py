@@ -0,0 +1,48 @@
+import unittest
+import shutil
+import numpy as np
+from offsetbasedgraph import GraphWithReversals as Graph, Block, \
+    DirectedInterval as Interval
+from graph_peak_caller.intervals import ColumnarIntervals
+
+
+class TestColumnarIntervals(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph({i: Block(5) for i in range(1, 5)},
+                           {1: [2, 3], 2: [4], 3: [4]})
+        self.intervals = [Interval(1, 3, [1, 2, 4], self.graph),
+                          Interval(2, 4, [3], self.graph),
+                          Interval(0, 5, [-4, -2], self.graph)]
+        self.columnar = ColumnarIntervals.from_intervals(self.intervals)
+
+    def test_from_intervals(self):
+        self.assertTrue(np.all(self.columnar.start_nodes == [1, 3, -4]))
+        self.assertTrue(np.all(self.columnar.end_nodes == [4, 3, -2]))
+        self.assertTrue(np.all(self.columnar.is_reverse ==
+                               [False, False, True]))
+        self.assertEqual(list(self.columnar), self.intervals)
+
+    def test_get_lengths(self):
+        lengths = self.columnar.get_lengths(self.graph)
+        self.assertTrue(np.all(lengths == [i.length() for i in self.intervals]))
+
+    def test_start_keys_ignore_end(self):
+        intervals = self.intervals + [Interval(1, 4, [1]),
+                                      Interval(1, 4, [-1])]
+        keys = ColumnarIntervals.from_intervals(intervals).get_start_keys()
+        self.assertEqual(keys[0], keys[3])
+        self.assertEqual(np.unique(keys).size, 4)
+
+    def test_to_from_file(self):
+        file_name = "test_reads.intervalarrays"
+        self.columnar.to_file(file_name)
+        new = ColumnarIntervals.from_file(file_name)
+        self.assertEqual(new.n_reads, 3)
+        self.assertEqual(list(new), self.intervals)
+        self.assertTrue(np.all(new.get_start_keys() ==
+                               self.columnar.get_start_keys()))
+        shutil.rmtree(file_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
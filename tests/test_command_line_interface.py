@@ -68,6 +68,28 @@ class TestCommandLineInterface(TestWrapper):
                              "-f", "10",
                              "-r", "7"])
 
+    def test_callpeaks_from_arrays(self):
+        run_argument_parser(["create_ob_graph", "-o",
+                             "tests/testgraph.obg",
+                             "tests/vg_test_graph.json"])
+        run_argument_parser(['create_linear_map', "--graph",
+                             "tests/testgraph.obg"])
+
+        IntervalCollection([Interval(1, 1, [1, 2])]).to_file(
+            "tests/sample.intervalcollection")
+        run_argument_parser(["alignments_to_arrays",
+                             "--graph", "tests/testgraph.obg",
+                             "tests/sample.intervalcollection",
+                             "tests/sample"])
+        self.assertTrue(os.path.isdir("tests/sample.intervalarrays"))
+
+        run_argument_parser(["callpeaks",
+                             "--graph", "tests/testgraph.obg",
+                             "-s", "tests/sample.intervalarrays",
+                             "-n", "tests/test_experiment_",
+                             "-f", "10",
+                             "-r", "7"])
+
     def _test_multigraph(self):
         run_argument_parser(["callpeaks_whole_genome",
                              "--chromosomes",
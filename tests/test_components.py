@@ -0,0 +1,19 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+import scipy.sparse.csgraph as csgraph
+from graph_peak_caller.postprocess.graphs import Components
+
+
+def test_components_with_end_node():
+    from_nodes = [0, 2, 1, 3, 4]
+    to_nodes = [2, 5, 4, 5, 5]
+    matrix = csr_matrix((np.arange(1, 6), (from_nodes, to_nodes)),
+                        shape=(6, 6))
+    n_components, labels = csgraph.connected_components(matrix[:5, :5])
+    components = Components(matrix, labels, n_components, end_node=5)
+    assert len(components) == 3
+    for comp in range(n_components):
+        nodes = components.get_nodes(comp)
+        assert np.array_equal(nodes, np.flatnonzero(labels == comp))
+        idxs = np.r_[nodes, 5]
+        assert (components.get_matrix(comp) != matrix[idxs][:, idxs]).nnz == 0
@@ -1,7 +1,11 @@
+import os
+import shutil
 import unittest
 from offsetbasedgraph import GraphWithReversals, Block, \
-        Interval
+        Interval, IntervalCollection
 from graph_peak_caller.control import SparseControl, LinearMap
+from graph_peak_caller.control.backgroundcache import BackgroundCache
+from graph_peak_caller.intervals import UniqueIntervals, LazyIntervals
 
 from graph_peak_caller.legacy.sparsepileup import \
     SparsePileup as OldSparsePileup, ValuedIndexes
@@ -107,6 +111,41 @@ class TestCreateControl(unittest.TestCase):
             correct_pileup[(rp-1)*3:rp*3] = [e1, e1, b]
         self.assertTrue(np.allclose(control, correct_pileup))
 
+    def test_cached_background(self):
+        fragment_length = 3
+        reads = [Interval(0, 3, [2]), Interval(1, 1, [8, 9])]
+        extension_sizes = [2, 8]
+        correct = SparseControl(
+            "test_linear_map.npz", self.graph, extension_sizes,
+            fragment_length, set(self.graph.blocks.keys())).create(reads)
+        IntervalCollection(reads).to_file("test_control.intervalcollection",
+                                          text_file=True)
+        read_file_names = []
+
+        def read_func(file_name):
+            read_file_names.append(file_name)
+            return IntervalCollection.from_file(file_name, text_file=True)
+
+        cache_dir = "test_background_cache"
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cache = BackgroundCache(cache_dir)
+        for _ in range(2):
+            sc = SparseControl("test_linear_map.npz", self.graph,
+                               extension_sizes, fragment_length,
+                               set(self.graph.blocks.keys()))
+            sc.set_cache(cache)
+            control_reads = UniqueIntervals(LazyIntervals(
+                "test_control.intervalcollection", read_func))
+            control = sc.create(control_reads)
+            self.assertTrue(np.allclose(control.to_dense_pileup(3*11),
+                                        correct.to_dense_pileup(3*11)))
+            self.assertEqual(control_reads.n_reads, 2)
+        self.assertEqual(read_file_names, ["test_control.intervalcollection"])
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        BackgroundCache(cache_dir, max_size=0)._evict()
+        self.assertEqual(len(os.listdir(cache_dir)), 0)
+        shutil.rmtree(cache_dir)
+
 
 class _TestCreateControlGraphWithDifferentLengths():
 
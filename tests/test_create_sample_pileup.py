@@ -3,11 +3,12 @@ from offsetbasedgraph import GraphWithReversals as Graph, Block, \
     DirectedInterval as Interval
 from graph_peak_caller import Configuration
 from graph_peak_caller.sample import get_fragment_pileup
-from graph_peak_caller.intervals import Intervals
+from graph_peak_caller.intervals import Intervals, ColumnarIntervals
 from util import from_intervals
 
 
 class Tester(unittest.TestCase):
+    use_array_extender = True
 
     def _create_reads(self):
         self.sample_reads = []
@@ -43,10 +44,14 @@ class Tester(unittest.TestCase):
         config = Configuration()
         config.fragment_length = self.fragment_length()
         config.read_length = self.read_length()
+        config.use_array_extender = self.use_array_extender
         self.fragment_pileup = get_fragment_pileup(
-            self.graph, Intervals(self.sample_reads),
+            self.graph, self.get_reads(),
             config)
 
+    def get_reads(self):
+        return Intervals(self.sample_reads)
+
     def do_asserts(self):
         self.run_callpeaks()
         self.assert_final_pileup_equals_correct_pileup()
@@ -172,5 +177,23 @@ class TestSplitGraph2(TestCase):
         self.do_asserts()
 
 
+class TestColumnarSplitGraph(TestSplitGraph):
+    def get_reads(self):
+        return ColumnarIntervals.from_intervals(self.sample_reads)
+
+
+class TestColumnarLinearGraph(TestLinearGraph):
+    def get_reads(self):
+        return ColumnarIntervals.from_intervals(self.sample_reads)
+
+
+class TestNodeInfoSplitGraph(TestSplitGraph):
+    use_array_extender = False
+
+
+class TestNodeInfoSplitGraph2(TestSplitGraph2):
+    use_array_extender = False
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from offsetbasedgraph import Interval, IntervalCollection
-from graph_peak_caller.intervals import UniqueIntervals
+import numpy as np
+from graph_peak_caller.intervals import UniqueIntervals, ColumnarIntervals
 
 
 class DummyLinearMap:
@@ -23,6 +24,35 @@ class TestFilterDulicates(unittest.TestCase):
         self.assertEqual(intervals_filtered[0], intervals[0])
         self.assertEqual(intervals_filtered[1], intervals[1])
 
+    def test_filter_duplicates_reverse(self):
+        intervals = [
+            Interval(0, 10, [1, 2, 3]),
+            Interval(0, 10, [-1, -2]),
+            Interval(0, 5, [1, 2])
+        ]
+        unique = UniqueIntervals(IntervalCollection(intervals))
+        intervals_filtered = list(unique)
+        self.assertEqual(intervals_filtered, intervals[:2])
+        self.assertEqual(unique.n_duplicates, 1)
+        self.assertEqual(unique.n_reads, 2)
+
+    def test_keep_mask_columnar(self):
+        intervals = [
+            Interval(0, 10, [1, 2, 3]),
+            Interval(1, 10, [1, 2, 3]),
+            Interval(0, 3, [1]),
+            Interval(1, 4, [2, 3])
+        ]
+        columnar = ColumnarIntervals.from_intervals(intervals)
+        unique = UniqueIntervals(columnar)
+        self.assertEqual(list(unique.get_keep_mask()),
+                         [True, True, False, True])
+        subset = unique.get_unique()
+        self.assertEqual(subset.n_reads, 3)
+        self.assertEqual(unique.n_duplicates, 1)
+        self.assertEqual(list(subset.region_paths), [1, 2, 3, 1, 2, 3, 2, 3])
+        self.assertTrue(np.all(subset.region_path_offsets == [0, 3, 6, 8]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,6 +2,7 @@ import pytest
 import offsetbasedgraph as obg
 
 from graph_peak_caller.control.linearmap import LinearMap
+from graph_peak_caller.intervals import ColumnarIntervals
 from graph_peak_caller.control.linearintervals import\
     LinearIntervalCollection
 
@@ -51,6 +52,16 @@ def test_from_snp_graph(snp_graph, snp_map):
     linear_map = LinearMap.from_graph(snp_graph)
     assert linear_map == snp_map
 
+def test_from_graph_equals_node_traversal():
+    nodes = {i: obg.Block(i % 7 + 1) for i in range(1, 11)}
+    edges = {1: [2, 3], 2: [4], 3: [4, 5], 4: [6], 5: [6, 7],
+             6: [8], 7: [8, 9], 8: [10], 9: [10]}
+    graph = obg.GraphWithReversals(nodes, edges)
+    graph.convert_to_numpy_backend()
+    assert LinearMap.from_graph(graph) == \
+        LinearMap.from_graph_by_node_traversal(graph)
+
+
 def test_get_scale_and_offset(hierarchical_map):
     node_ids = [100, 101, 102, 103, 104, 105]
     scales = [1, 26/11, 1, 14/13, 1, 1]
@@ -78,3 +89,18 @@ def test_map_interval_collection(hierarchical_map):
                  36+5]
     true_linear = LinearIntervalCollection(true_starts, true_ends)
     assert linear_intervals == true_linear
+
+
+def test_map_read_arrays():
+    nodes = {i: obg.Block(i*3) for i in range(1, 6)}
+    edges = {1: [2, 3], 2: [4], 3: [4], 4: [5]}
+    graph = obg.GraphWithReversals(nodes, edges)
+    graph.convert_to_numpy_backend()
+    linear_map = LinearMap.from_graph(graph)
+    intervals = [obg.Interval(1, 2, [1, 2], graph),
+                 obg.Interval(2, 5, [3, 4], graph),
+                 obg.Interval(0, 4, [-4, -3], graph),
+                 obg.Interval(3, 7, [-5], graph)]
+    reads = ColumnarIntervals.from_intervals(intervals)
+    assert linear_map.map_read_arrays(reads) == \
+        linear_map.map_interval_collection(intervals)
@@ -1,6 +1,9 @@
 import unittest
 import numpy as np
+import offsetbasedgraph as obg
 from graph_peak_caller.control.linearpileup import LinearPileup
+from graph_peak_caller.control.linearmap import LinearMap
+from graph_peak_caller.touchednodes import TouchedNodes
 
 
 class TestLinearPileup(unittest.TestCase):
@@ -30,5 +33,26 @@ class TestLinearPileup(unittest.TestCase):
                                 np.array([25, 15, 25]))
         self.assertEqual(pileup1, true_max)
 
+    def test_to_sparse_pileup(self):
+        graph = obg.GraphWithReversals(
+            {1: obg.Block(4), 2: obg.Block(2), 3: obg.Block(4),
+             4: obg.Block(3)},
+            {1: [2, 3], 2: [4], 3: [4]})
+        graph.convert_to_numpy_backend()
+        linear_map = LinearMap.from_graph(graph)
+        pileup = LinearPileup(np.array([0, 3, 5, 9]),
+                              np.array([1., 2., 4., 0.5]))
+        for touched_nodes in (None, {1, 2, 4},
+                              TouchedNodes.from_node_ids([1, 2, 4])):
+            sparse_pileup = pileup.to_sparse_pileup(
+                linear_map, touched_nodes, min_value=0.2)
+            true_pileup = pileup.to_sparse_pileup_by_events(
+                linear_map, touched_nodes, min_value=0.2)
+            self.assertTrue(np.all(
+                sparse_pileup._indices == true_pileup._indices))
+            self.assertTrue(np.allclose(
+                sparse_pileup._diffs, true_pileup._diffs))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,22 @@
+import numpy as np
+from offsetbasedgraph import GraphWithReversals as Graph, Block, \
+    DirectedInterval as Interval
+from graph_peak_caller.mindense import DensePileup
+
+
+def test_get_intervals_values():
+    graph = Graph({i: Block(10) for i in range(1, 4)},
+                  {1: [2], 2: [3]})
+    graph.convert_to_numpy_backend()
+    pileup = DensePileup(graph, np.arange(30))
+    intervals = [Interval(5, 5, [1, 2], graph),
+                 Interval(3, 6, [1], graph),
+                 Interval(8, 2, [1, 2, 3], graph)]
+    values, offsets = pileup.get_intervals_values(intervals)
+    assert list(offsets) == [0, 10, 13, 27]
+    assert np.array_equal(values[0:10], np.arange(5, 15))
+    assert np.array_equal(values[10:13], np.arange(3, 6))
+    assert np.array_equal(values[13:], np.arange(8, 22))
+    for i, interval in enumerate(intervals):
+        assert np.array_equal(pileup.get_interval_values(interval),
+                              values[offsets[i]:offsets[i+1]])
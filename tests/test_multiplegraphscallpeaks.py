@@ -1,5 +1,6 @@
 from graph_peak_caller.multiplegraphscallpeaks import MultipleGraphsCallpeaks
-from graph_peak_caller.intervals import Intervals
+from graph_peak_caller.intervals import Intervals, ColumnarIntervals, \
+    UniqueIntervals
 from graph_peak_caller import Configuration
 from graph_peak_caller.reporter import Reporter
 from offsetbasedgraph import GraphWithReversals as Graph, \
@@ -11,6 +12,8 @@ import logging
 from graph_peak_caller.logging_config import set_logging_config
 #set_logging_config(1)
 import os
+import json
+import shutil
 from graph_peak_caller.command_line_interface import run_argument_parser
 
 
@@ -98,6 +101,63 @@ class TestMultipleGraphsCallPeaks(unittest.TestCase):
         caller.run()
         self.do_asserts()
 
+    def test_run_from_init_parallel(self):
+        caller = MultipleGraphsCallpeaks(
+            self.chromosomes,
+            [chrom + ".nobg" for chrom in self.chromosomes],
+            self.sample_reads,
+            self.control_reads,
+            self.linear_maps,
+            self.config,
+            self.reporter,
+            n_workers=2
+        )
+        caller.run()
+        self.do_asserts()
+
+    def test_run_with_profile(self):
+        caller = MultipleGraphsCallpeaks(
+            self.chromosomes,
+            [chrom + ".nobg" for chrom in self.chromosomes],
+            self.sample_reads,
+            self.control_reads,
+            self.linear_maps,
+            self.config,
+            Reporter("multigraphs_", profile=True)
+        )
+        caller.run()
+        self.do_asserts()
+        with open("multigraphs_1_profile.json") as f:
+            profile = json.load(f)
+        for stage in ["run_to_p_values", "p_values", "run_from_p_values",
+                      "hole_cleaning", "sparse_max_paths"]:
+            self.assertGreaterEqual(profile[stage]["wall_time"], 0)
+            self.assertGreaterEqual(
+                profile[stage]["peak_rss_increase_mb"], 0)
+            self.assertGreater(profile[stage]["process_peak_rss_mb"], 0)
+        self.assertEqual(profile["max_paths"]["sizes"]["n_max_paths"], 1)
+
+    def test_get_intervals_mixed_file_types(self):
+        caller = MultipleGraphsCallpeaks(
+            self.chromosomes[:1], [self.chromosomes[0] + ".nobg"],
+            ["sample.intervalarrays"], ["control.intervalcollection"],
+            self.linear_maps[:1], self.config, self.reporter)
+        reads = [Interval(2, 4, [1]), Interval(2, 4, [1]),
+                 Interval(3, 5, [2])]
+        ColumnarIntervals.from_intervals(reads).to_file(
+            "sample.intervalarrays")
+        IntervalCollection(reads).to_file(
+            "control.intervalcollection", text_file=True)
+        sample, control = caller.get_intervals(
+            "sample.intervalarrays", "control.intervalcollection", None)
+        self.assertEqual(len(list(sample)), 2)
+        self.assertEqual(len(list(control)), 2)
+
+        sample, _ = caller.get_intervals(
+            ColumnarIntervals.from_intervals(reads), control, None)
+        self.assertIsInstance(sample, UniqueIntervals)
+        self.assertEqual(len(list(sample)), 2)
+
     def test_run_from_init_in_two_steps(self):
 
         set_logging_config(2)
@@ -166,6 +226,71 @@ class TestMultipleGraphsCallPeaksCommandLine(TestMultipleGraphsCallPeaks):
                                  "-n", "multigraphs_"])
         self.do_asserts()
 
+    def test_resume(self):
+        for chrom in self.chromosomes:
+            if os.path.isfile("multigraphs_%s_manifest.json" % chrom):
+                os.remove("multigraphs_%s_manifest.json" % chrom)
+        args = ["callpeaks",
+                "-g", "*.nobg",
+                "-s", "test_sample_*.intervalcollection",
+                "-f", "%s" % self.fragment_length,
+                "-r", "%s" % self.read_length,
+                "-u", "100",
+                "-G", "150",
+                "-n", "multigraphs_",
+                "-D", "True",
+                "-R", "True"]
+        run_argument_parser(args)
+        self.do_asserts()
+        output_files = ["multigraphs_%s_%s" % (chrom, ending)
+                        for chrom in self.chromosomes
+                        for ending in ["pvalues_values.npy",
+                                       "max_paths.intervalcollection"]]
+        mtimes = [os.stat(f).st_mtime_ns for f in output_files]
+        run_argument_parser(args)
+        self.assertEqual([os.stat(f).st_mtime_ns for f in output_files],
+                         mtimes)
+        self.do_asserts()
+
+    def test_background_cache(self):
+        shutil.rmtree("test_multigraphs_cache", ignore_errors=True)
+        args = ["callpeaks",
+                "-g", "*.nobg",
+                "-s", "test_sample_*.intervalcollection",
+                "-f", "%s" % self.fragment_length,
+                "-r", "%s" % self.read_length,
+                "-u", "100",
+                "-G", "150",
+                "-n", "multigraphs_",
+                "-D", "True",
+                "-B", "test_multigraphs_cache"]
+        for _ in range(2):
+            run_argument_parser(args)
+            self.do_asserts()
+        self.assertEqual(len(os.listdir("test_multigraphs_cache")),
+                         len(self.chromosomes))
+        shutil.rmtree("test_multigraphs_cache")
+
+    def test_text_all_max_paths(self):
+        file_names = ["multigraphs_%s_all_max_paths.intervalcollection" % chrom
+                      for chrom in self.chromosomes]
+        for file_name in file_names:
+            if os.path.isfile(file_name):
+                os.remove(file_name)
+        run_argument_parser(["callpeaks",
+                             "-g", "*.nobg",
+                             "-s", "test_sample_*.intervalcollection",
+                             "-f", "%s" % self.fragment_length,
+                             "-r", "%s" % self.read_length,
+                             "-u", "100",
+                             "-G", "150",
+                             "-n", "multigraphs_",
+                             "-D", "True",
+                             "-T", "True"])
+        self.do_asserts()
+        for file_name in file_names:
+            self.assertTrue(os.path.isfile(file_name))
+
     def test_count_unique_reads(self):
         reads = [
             IntervalCollection([
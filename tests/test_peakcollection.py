@@ -5,6 +5,7 @@ from graph_peak_caller.analysis.nongraphpeaks import NonGraphPeak,\
 from offsetbasedgraph import GraphWithReversals as Graph, \
     Block, DirectedInterval as Interval
 from graph_peak_caller.analysis.analyse_peaks import LinearRegion
+from graph_peak_caller.sparsediffs import SparseValues
 
 
 class TestPeakCollection(unittest.TestCase):
@@ -19,6 +20,29 @@ class TestPeakCollection(unittest.TestCase):
             ]
         )
 
+    def test_to_from_peaks_file(self):
+        self.peaks.intervals[0].score = 2.5
+        self.peaks.intervals[0].unique_id = "peak0"
+        self.peaks.intervals[0].chromosome = "chr1"
+        self.peaks.intervals[1].info = (True, False)
+        self.peaks.to_peaks_file("test_peaks.peaks.npz")
+        new_peaks = PeakCollection.from_peaks_file(
+            "test_peaks.peaks.npz", self.graph)
+        self.assertEqual(len(new_peaks.intervals), 2)
+        for peak, new_peak in zip(self.peaks.intervals, new_peaks.intervals):
+            self.assertEqual(peak, new_peak)
+            self.assertEqual(peak.to_file_line(), new_peak.to_file_line())
+
+    def test_cut_around_summit_from_file(self):
+        self.graph.convert_to_numpy_backend()
+        q_values = SparseValues([0, 3, 6], [1, 5, 1])
+        q_values.track_size = 18
+        q_values.to_sparse_files("test_cut_qvalues")
+        q_values = SparseValues.from_sparse_files("test_cut_qvalues")
+        peaks = PeakCollection([Peak(0, 3, [1, 2, 3], self.graph)])
+        peaks.cut_around_summit(q_values, self.graph, n_base_pairs_around=1)
+        self.assertEqual(peaks.intervals[0], Peak(0, 2, [2], self.graph))
+
     def test_contains_interval(self):
         self.assertTrue(self.peaks.contains_interval(Peak(3, 3, [1, 2, 3, 4])))
         self.assertFalse(self.peaks.contains_interval(Peak(2, 3, [1, 2, 3, 4])))
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import numpy as np
+import offsetbasedgraph as obg
+from graph_peak_caller.peakcollection import Peak
+from graph_peak_caller.peakfasta import SequenceIndex, PeakFasta
+
+
+def get_sequence_graph():
+    graph = obg.GraphWithReversals({i: obg.Block(4) for i in range(1, 4)},
+                                   {1: [2], 2: [3]})
+    graph.convert_to_numpy_backend()
+    sequence_graph = obg.SequenceGraph.create_empty_from_ob_graph(graph)
+    for node, sequence in zip([1, 2, 3], ["acgt", "ggcc", "tnaa"]):
+        sequence_graph.set_sequence(node, sequence)
+    return graph, sequence_graph
+
+
+def test_get_sequences():
+    graph, sequence_graph = get_sequence_graph()
+    peaks = [Peak(1, 3, [1], graph),
+             Peak(2, 2, [1, 2, 3], graph),
+             Peak(1, 3, [-3, -2], graph),
+             Peak(0, 4, [2, -1], graph)]
+    sequences = SequenceIndex.from_sequence_graph(
+        sequence_graph).get_sequences(peaks)
+    assert sequences == ["cg", "gtggcctn", "tnaggc", "ggccacgt"]
+    assert sequences == [sequence_graph.get_interval_sequence(peak)
+                         for peak in peaks]
+
+
+def test_from_sequence_array():
+    index = SequenceIndex.from_sequence_array(1, [0, 5], [1, 2, 0, 3, 4])
+    assert index.get_sequences([Peak(0, 5, [1]), Peak(0, 5, [-1])]) == \
+        ["acntg", "cangt"]
+
+
+def test_from_file_is_cached():
+    graph, sequence_graph = get_sequence_graph()
+    sequence_graph.to_file("test_peakfasta.sequences")
+    files = set(os.listdir("."))
+    index = SequenceIndex.from_file("test_peakfasta.sequences")
+    assert set(os.listdir(".")) == files
+    with tempfile.TemporaryDirectory() as cache_dir:
+        SequenceIndex.from_file("test_peakfasta.sequences", cache_dir)
+        assert len(os.listdir(cache_dir)) == 3
+        index = SequenceIndex.from_file("test_peakfasta.sequences",
+                                        cache_dir)
+        assert isinstance(index._bases, np.memmap)
+        PeakFasta(index).write_max_path_sequences(
+            "test_peakfasta.fasta", [Peak(2, 2, [1, 2], graph, score=1.0)])
+    with open("test_peakfasta.fasta") as f:
+        lines = f.read().split("\n")
+    assert lines[0].startswith(">peak0 {")
+    assert lines[1] == "gtgg"
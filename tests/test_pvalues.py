@@ -1,4 +1,6 @@
-from graph_peak_caller.sparsepvalues import PToQValuesMapper, PValuesFinder
+from graph_peak_caller.sparsepvalues import PToQValuesMapper, PValuesFinder,\
+    PValuesHistogram, PToQTable, QValuesFinder, PoissonPValuesCache, \
+    get_p_values_cache
 from graph_peak_caller.sparsediffs import SparseValues
 from offsetbasedgraph import GraphWithReversals as Graph,\
     DirectedInterval as Interval, Block
@@ -24,6 +26,43 @@ class TestPToQValuesMapper(unittest.TestCase):
         q_val_05 = 0.5 + (np.log10(4) - np.log10(6))
         self.assertAlmostEqual(mapping[0.5], q_val_05)
 
+    def test_from_histograms(self):
+        p_values_a = SparseValues([0, 2, 4], [2., 1., 0.5])
+        p_values_a.track_size = 10
+        p_values_b = SparseValues([0, 3], [1., 2.])
+        p_values_b.track_size = 4
+        histogram = PValuesHistogram.from_p_values_pileup(p_values_a) + \
+            PValuesHistogram.from_p_values_pileup(p_values_b)
+        self.assertEqual(histogram, PValuesHistogram([0.5, 1., 2.],
+                                                     [6, 5, 3]))
+        mapper = PToQValuesMapper.from_histogram(histogram)
+        self.assertEqual(list(mapper.p_values), [2., 1., 0.5])
+        self.assertEqual(list(mapper.cum_counts), [3, 8, 14])
+
+    def test_table_matches_dict(self):
+        mapper = PToQValuesMapper([2., 1., 0.5], [2, 3, 6])
+        mapping = mapper.get_p_to_q_values()
+        table = mapper.get_p_to_q_table()
+        self.assertEqual(list(table.p_values), [0, 0.5, 1., 2.])
+        q_values = table.get_q_values(np.array([2., 0., 0.5, 1., 3.]))
+        for p, q in zip([2., 0., 0.5, 1.], q_values):
+            self.assertAlmostEqual(mapping[p], q)
+        self.assertTrue(np.isnan(q_values[-1]))
+
+    def test_table_to_file(self):
+        table = PToQValuesMapper([2., 1., 0.5], [2, 3, 6]).get_p_to_q_table()
+        table.to_file("test_")
+        self.assertEqual(PToQTable.from_file("test_"), table)
+
+    def test_q_values_finder(self):
+        mapper = PToQValuesMapper([2., 1., 0.5], [2, 3, 6])
+        p_values = SparseValues(np.array([0, 3, 5]), np.array([0., 2., 1.]))
+        from_table = QValuesFinder(
+            p_values, mapper.get_p_to_q_table()).get_q_values()
+        from_dict = QValuesFinder(
+            p_values, mapper.get_p_to_q_values()).get_q_values()
+        self.assertEqual(from_table, from_dict)
+
 
 class TestPValuesFinder(unittest.TestCase):
 
@@ -65,6 +104,28 @@ class TestPValuesFinder(unittest.TestCase):
         correct = SparseValues([0, 3, 6], [0, -np.log10(0.08030), 0])
         self.assertEqual(p_values, correct)
 
+    def test_with_cache(self):
+        sample = from_intervals(
+            self.graph, [Interval(0, 3, [2]), Interval(0, 3, [2])])
+        control = from_intervals(
+            self.graph, [Interval(0, 3, [1, 2])])
+        cache = PoissonPValuesCache(1)
+        correct = SparseValues([0, 3, 6], [0, -np.log10(0.08030), 0])
+        for _ in range(2):
+            p_values = PValuesFinder(
+                sample, control, cache).get_p_values_pileup()
+            self.assertEqual(p_values, correct)
+        self.assertEqual(len(cache), 1)
+
+    def test_cache_with_lambda_decimals(self):
+        cache = get_p_values_cache(10, lambda_decimals=1)
+        self.assertIsNot(cache, get_p_values_cache(10))
+        self.assertIs(cache, get_p_values_cache(10, lambda_decimals=1))
+        p_values = cache.get_p_values(np.array([2, 2]),
+                                      np.array([0.51, 0.52]))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(p_values[0], p_values[1])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -17,6 +17,24 @@ class TestSparseValues(unittest.TestCase):
         new = sv.from_sparse_files("test_sparsevalues.tmp")
         self.assertEqual(sv, new)
 
+    def test_get_interval_scores(self):
+        sv = SparseValues([2, 5, 8, 12], [3, 1, 3, 0])
+        dense = sv.to_dense_pileup(15)
+        starts = [0, 3, 7, 9, 1]
+        ends = [4, 6, 10, 14, 2]
+        interval_ids = [0, 1, 1, 1, 2]
+        maxes, means, summits = sv.get_interval_scores(
+            starts, ends, interval_ids)
+        for i in range(3):
+            values = np.concatenate(
+                [dense[s:e] for s, e, j in zip(starts, ends, interval_ids)
+                 if j == i])
+            max_positions = np.flatnonzero(values == values.max())
+            self.assertEqual(maxes[i], values.max())
+            self.assertAlmostEqual(means[i], values.mean())
+            self.assertEqual(summits[i],
+                             max_positions[max_positions.size//2])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -79,6 +79,16 @@ def test_long_hole():
     assert holes == pileup
 
 
+def test_small_hole_over_many_nodes():
+    pileup = SparseValues([0, 5, 55],
+                          [True, False, True])
+    graph = obg.GraphWithReversals(
+        {i: obg.Block(1) for i in range(1, 101)},
+        {i: [i+1] for i in range(1, 100)})
+    holes = HolesCleaner(graph, pileup, 60).run()
+    assert holes == SparseValues([0], [True])
+
+
 def test_complicated(complicated_graph):
     # graph = complicated_graph()
     #                      
@@ -134,6 +144,17 @@ def test_non_touched_mid(small_graph):
     assert cleaned == true
 
 
+def test_non_touched_full(small_graph):
+    touched_nodes = set([101, 102, 103, 105, 106])
+    pileup = SparseValues([0, 30, 40], [1, 0, 1])
+    cleaned = HolesCleaner(small_graph, pileup, 20, touched_nodes).run()
+    assert cleaned == SparseValues([0, 30, 40], [1, 0, 1])
+    touched_nodes.add(104)
+    pileup = SparseValues([0, 30, 40], [1, 0, 1])
+    cleaned = HolesCleaner(small_graph, pileup, 20, touched_nodes).run()
+    assert cleaned == SparseValues([0], [1])
+
+
 if __name__ == "__main__":
     # test_holes_cleaner()
     # test_end_hole()
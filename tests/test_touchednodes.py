@@ -0,0 +1,30 @@
+import numpy as np
+from graph_peak_caller.touchednodes import TouchedNodes
+
+
+def test_contains():
+    touched = TouchedNodes.from_mask(
+        [True, False, True, True, False, False, False, False, False, True],
+        min_node=10)
+    assert list(touched) == [10, 12, 13, 19]
+    assert len(touched) == 4
+    assert 12 in touched
+    assert 11 not in touched
+    assert 9 not in touched
+    assert 30 not in touched
+    assert np.array_equal(touched.contains_many([9, 10, 11, 19, 20]),
+                          [False, True, False, True, False])
+
+
+def test_to_from_file():
+    touched = TouchedNodes.from_node_ids([3, 5, 17], min_node=1)
+    touched.to_file("test_touched_nodes.npy")
+    new = TouchedNodes.from_file("test_touched_nodes.npy", 1)
+    assert new == touched
+    assert np.load("test_touched_nodes.npy").nbytes == 3
+
+
+def test_from_node_id_file():
+    np.save("test_touched_nodes.npy", np.array([17, 3, 5]))
+    touched = TouchedNodes.from_file("test_touched_nodes.npy", 1)
+    assert list(touched) == [3, 5, 17]
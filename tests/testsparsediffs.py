@@ -9,6 +9,22 @@ def test_maximum():
                                        [2, 1, -1, 1, -1, -2])
 
 
+def test_maximum_of():
+    a = SparseDiffs([0, 1, 3, 5, 7, 10], [1, 1, 1, -1, -1, -1])
+    b = SparseDiffs([0, 2, 3, 6, 9, 10], [2, -1, 1, 1, -1, -2])
+    c = SparseDiffs([4, 8], [4, -4])
+    assert SparseDiffs.maximum_of([a, b, c]) == SparseDiffs(
+        [0, 3, 4, 8, 9, 10], [2, 1, 1, -1, -1, -2])
+
+
+def test_apply_binary_func():
+    a = SparseDiffs([0, 1, 3], [1, 1, -2])
+    b = SparseDiffs([0, 2], [3, -1])
+    values = a.apply_binary_func(np.add, b, return_values=True)
+    assert np.all(values.indices == [0, 1, 2, 3])
+    assert np.all(values.values == [4, 5, 4, 2])
+
+
 def test_from_startends():
     a = np.array([[1, 10, 9, 7, 11],
                   [3, 12, 11, 9, 13]])
@@ -3,6 +3,9 @@ from graph_peak_caller.postprocess.maxpaths import SparseMaxPaths
 from graph_peak_caller.sparsediffs import SparseValues
 from graph_peak_caller.peakcollection import Peak
 import numpy as np
+from types import SimpleNamespace
+from scipy.sparse import csr_matrix
+from graph_peak_caller.postprocess.graphs import PosDividedLineGraph
 
 
 nodes = {i+1: obg.Block(10) for i in range(10)}
@@ -114,6 +117,47 @@ def test_multiple_peak():
                          Peak(0, 2, [105, 107], graph=graph)]
 
 
+def test_max_path_info():
+    pileup = SparseValues([0, 5, 35], [False, True, False])
+    score_pileup = SparseValues([0, 5, 10, 20, 30, 35],
+                                [0, 1, 2, 3, 4, 0])
+    score_pileup.track_size = 100
+    pileup.track_size = 100
+    max_paths, _ = SparseMaxPaths(pileup, graph, score_pileup).run()
+    assert max_paths == [Peak(5, 5, [1, 3, 4], graph=graph)]
+    assert max_paths[0].info == (True, False)
+
+
+def test_ambiguous_max_path():
+    pileup = SparseValues([0, 5, 35], [False, True, False])
+    score_pileup = SparseValues([0, 5, 10, 30, 35],
+                                [0, 1, 2, 4, 0])
+    score_pileup.track_size = 100
+    pileup.track_size = 100
+    max_paths, _ = SparseMaxPaths(pileup, graph, score_pileup).run()
+    assert len(max_paths) == 1
+    assert max_paths[0].info == (True, True)
+
+
+def test_component_without_start_node():
+    # Nodes 0 -> 1 and 2 -> 3 both lead to the end stub 4, but only node 0
+    # can start a path
+    matrix = csr_matrix(([1, 2, 3, 4], ([0, 1, 2, 3], [1, 4, 3, 4])),
+                        shape=(5, 5))
+    linegraph = object.__new__(PosDividedLineGraph)
+    linegraph._matrix = matrix
+    linegraph.end_stub = 4
+    linegraph.n_starts = 1
+    linegraph.n_ends = 0
+    linegraph.n_nodes = 4
+    linegraph.filtered = SimpleNamespace(_full_starts=np.array([], dtype="int"),
+                                         _end_starts=np.array([], dtype="int"))
+    linegraph._all_nodes = np.arange(4)
+    paths, infos, _ = linegraph.max_paths()
+    assert [list(path) for path in paths] == [[0, 1], [2]]
+    assert infos[1] == (0, 0)
+
+
 if __name__ == "__main__":
     # test_simple_peak()
     # test_offset_peak()